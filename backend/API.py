@@ -1,4 +1,4 @@
-from fastapi import FastAPI, HTTPException, Request, UploadFile, File, Form
+from fastapi import BackgroundTasks, FastAPI, HTTPException, Request, UploadFile, File, Form
 from pydantic import BaseModel
 import requests
 import sqlite3
@@ -11,13 +11,21 @@ from fastapi.responses import RedirectResponse
 from uuid import uuid4
 import os
 import io
-
-from chunker2 import chunk_pdf
-from ner_extractor import map_keywords_to_chunks
-from keyword_filter import filter_keys
-from graph_builder2 import KnowledgeGraphBuilder
-from config import DOCUMENTS_DIR, NEO4J_URI, NEO4J_USER, NEO4J_PASSWORD, NEO4J_DATABASE
-from graph_retriever2 import GraphRetriever
+import threading
+
+import chunker2
+import ner_extractor
+from chunker2 import chunk_pdf, ChunkStream
+from ner_extractor import collect_keywords
+from keyword_filter import filter_keys, filter_keys_streaming, StreamingDocumentFrequency
+from keyword_postings import PostingsBuilder, SpooledPostingsBuilder
+from graph_backend import create_graph_builder
+from ingest_cache import ingest_cache, hash_upload
+from ner_cache import ner_cache
+from config import DOCUMENTS_DIR, NEO4J_URI, NEO4J_USER, NEO4J_PASSWORD, NEO4J_DATABASE, STREAM_CHUNKING, NLP_WARMUP_ON_STARTUP, \
+    GRAPH_SYNC_MODE, KEYWORD_FILTER_STREAMING
+from graph_retriever2 import GraphRetriever, vocabulary_cache
+from neo4j_driver import close_all as close_neo4j_drivers, pool_stats
 
 app = FastAPI()
 
@@ -45,6 +53,41 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+def _warm_up_nlp():
+    try:
+        chunker2.warm_up()
+        ner_extractor.warm_up()
+        print("[INFO] NLP models warmed up")
+    except Exception as e:
+        print(f"[WARN] NLP warm-up failed, models will load on first upload: {e}")
+
+
+@app.on_event("startup")
+def start_nlp_warm_up():
+    # Load models in the background so startup (and health checks) are not blocked
+    if NLP_WARMUP_ON_STARTUP:
+        threading.Thread(target=_warm_up_nlp, name="nlp-warm-up", daemon=True).start()
+
+@app.on_event("shutdown")
+def shutdown_neo4j_drivers():
+    close_neo4j_drivers()
+
+
+@app.get("/neo4j/pool")
+def neo4j_pool_stats():
+    """Utilization of the shared Neo4j connection pools."""
+    return {"drivers": pool_stats()}
+
+
+@app.get("/cache/stats")
+def cache_stats():
+    """Hit/miss metrics of the in-process and on-disk caches."""
+    return {
+        "vocabulary": vocabulary_cache.stats(),
+        "ingest": ingest_cache.stats(),
+        "ner": ner_cache.stats(),
+    }
+
 # Get database path from environment or use default
 import config
 DB_PATH = os.getenv("THREADS_DB_PATH") or os.path.join(config.BASE_DIR, "threads.db")
@@ -176,11 +219,25 @@ def insurance_login(req: InsuranceCredentialsRequest):
             detail="Invalid insurance credentials. Please check your username and password."
         )
 
+def purge_thread_graphs(thread_ids):
+    """Background task: removes the graphs of deleted threads."""
+    try:
+        kg = create_graph_builder()
+        try:
+            kg.clear_threads(thread_ids)
+        finally:
+            kg.close()
+    except Exception as e:
+        print(f"[ERROR] Graph purge failed for threads {thread_ids}: {e}")
+
+
 @app.delete("/users/{user_id}")
-def delete_user_account(user_id: str):
+def delete_user_account(user_id: str, background_tasks: BackgroundTasks):
     user = db_session.get_user(user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
+    # Read before the rows are deleted; the graphs are purged after the response
+    thread_ids = db_session.get_thread_ids(user_id)
     success = db_session.delete_user_account(user_id)
     if not success:
         raise HTTPException(status_code=500, detail="Failed to delete user account")
@@ -188,6 +245,8 @@ def delete_user_account(user_id: str):
         insurance_credentials_db.delete_insurance_credentials(user_id)
     except Exception as e:
         print(f"Warning: Failed to delete insurance credentials: {e}")
+    if thread_ids:
+        background_tasks.add_task(purge_thread_graphs, thread_ids)
     return {
         "status": "success",
         "message": "User account and all associated data deleted successfully"
@@ -258,25 +317,60 @@ def append_message(thread_id: str, role: str, message: str):
 
 @app.post("/threads/upload")
 def upload_pdf(thread_id: str = Form(...), file: UploadFile = File(...)):
-    file_content = file.file.read()
-    file_stream = io.BytesIO(file_content)
-    chunks = chunk_pdf(file_stream)
-    print(f"Loaded {len(chunks)} chunks for thread {thread_id}.")
-    key_chunk_map = map_keywords_to_chunks(chunks)
-    print(f"NER keywords {len(key_chunk_map.keys())} unique keywords/entities")
-    filtered_map = filter_keys(key_chunk_map, len(chunks))
-    print(f"Filtered {len(filtered_map.keys())} unique keywords/entities")
+    pdf_sha256 = hash_upload(file.file)
+    cached = ingest_cache.get(pdf_sha256)
+    if cached:
+        # Same PDF and chunking/filter config seen before: skip straight to graph writes
+        chunk_count = cached["chunk_count"]
+        filtered_map = cached["filtered_map"]
+        print(f"Ingest cache hit for thread {thread_id}: {chunk_count} chunks, "
+              f"{len(filtered_map)} keywords ({ingest_cache.stats()})")
+    else:
+        if KEYWORD_FILTER_STREAMING:
+            # Keywords go to disk and into a fixed-size DF sketch instead of in-memory posting lists
+            df_counter = StreamingDocumentFrequency()
+            postings = SpooledPostingsBuilder(on_chunk=df_counter.add_chunk)
+        else:
+            postings = PostingsBuilder()
+        if STREAM_CHUNKING:
+            # The spooled upload file is read page by page; chunks flow straight into NER
+            chunks = ChunkStream(file.file)
+            collect_keywords(chunks, postings)
+            chunk_count = chunks.count
+            print(f"Streamed {chunk_count} chunks for thread {thread_id}.")
+        else:
+            file_content = file.file.read()
+            file_stream = io.BytesIO(file_content)
+            chunk_list = chunk_pdf(file_stream)
+            chunk_count = len(chunk_list)
+            print(f"Loaded {chunk_count} chunks for thread {thread_id}.")
+            collect_keywords(chunk_list, postings)
+        if KEYWORD_FILTER_STREAMING:
+            filtered_map = filter_keys_streaming(postings, df_counter)
+        else:
+            key_chunk_map = postings.build()
+            print(f"NER keywords {len(key_chunk_map.keys())} unique keywords/entities")
+            filtered_map = filter_keys(key_chunk_map, chunk_count)
+        print(f"Filtered {len(filtered_map.keys())} unique keywords/entities")
+        ingest_cache.put(pdf_sha256, filtered_map, chunk_count)
     keywords = sorted(filtered_map.keys())
-    kg = KnowledgeGraphBuilder()
-    kg.clear_graph(thread_id)
-    print(f"Cleared existing graph for thread {thread_id}.")
-    kg.build_graph_from_map(filtered_map, thread_id)
+    kg = create_graph_builder()
+    graph_diff = None
+    if GRAPH_SYNC_MODE == "incremental":
+        # Only the chunks/keywords/edges that changed since the last upload are written
+        graph_diff = kg.sync_graph_from_map(filtered_map, thread_id)
+    else:
+        kg.clear_graph(thread_id)
+        print(f"Cleared existing graph for thread {thread_id}.")
+        kg.build_graph_from_map(filtered_map, thread_id)
     kg.close()
     print("Knowledge graph built successfully.")
     return {
         "thread_id": thread_id,
-        "chunks": len(chunks),
+        "chunks": chunk_count,
         "keywords": len(filtered_map.keys()),
+        "ingest_cache_hit": bool(cached),
+        "graph_diff": graph_diff,
         "status": "graph built from in-memory PDF"
     }
 
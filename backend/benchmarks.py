@@ -0,0 +1,400 @@
+# benchmarks.py
+#
+# Ingestion and retrieval micro-benchmarks. Run from the backend directory, e.g.
+#   python benchmarks.py dedup --pages 500
+
+import argparse
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+SYNTHETIC_WORDS = (
+    "policy member claim benefit insurance premium coverage employer plan "
+    "certificate dependent spouse child accident sickness injury hospital "
+    "physician treatment expense deductible limit notice proof payment "
+    "beneficiary termination effective date amendment rider exclusion"
+).split()
+
+BOILERPLATE_SENTENCES = [
+    "This certificate is subject to all the terms of the group policy.",
+    "Please read this certificate carefully and keep it in a safe place.",
+    "Benefits are payable only for covered expenses incurred while insured.",
+]
+
+
+def synthetic_sentence(rng: random.Random) -> str:
+    if rng.random() < 0.1:
+        return rng.choice(BOILERPLATE_SENTENCES)
+    words = [rng.choice(SYNTHETIC_WORDS) for _ in range(rng.randint(6, 20))]
+    return " ".join(words).capitalize() + "."
+
+
+def write_synthetic_pdf(path: str, pages: int, seed: int = 0) -> str:
+    """Renders a policy-like PDF of `pages` pages of random sentences."""
+    from reportlab.lib.pagesizes import letter
+    from reportlab.pdfgen import canvas
+
+    rng = random.Random(seed)
+    c = canvas.Canvas(path, pagesize=letter)
+    for _ in range(pages):
+        y = 750
+        line = ""
+        while y > 60:
+            line = (line + " " + synthetic_sentence(rng)).strip()
+            while len(line) > 90 and y > 60:
+                c.drawString(50, y, line[:90])
+                line = line[90:]
+                y -= 14
+        c.showPage()
+    c.save()
+    return path
+
+
+def _naive_dedup(chunks):
+    """The original all-pairs containment scan from chunk_pdf, kept as reference."""
+    deduped_chunks = []
+    for i, chunk_i in enumerate(chunks):
+        content_i = chunk_i["content"]
+        is_subset = False
+        for j, chunk_j in enumerate(chunks):
+            if i != j:
+                content_j = chunk_j["content"]
+                if content_i in content_j:
+                    is_subset = True
+                    break
+        if not is_subset:
+            deduped_chunks.append(chunk_i)
+    return deduped_chunks
+
+
+def bench_dedup(args):
+    import pdfplumber
+    from chunker2 import split_into_chunks, dedup_chunks
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pdf_path = args.pdf or write_synthetic_pdf(os.path.join(tmp, "synthetic.pdf"), args.pages)
+        start = time.perf_counter()
+        all_chunks = []
+        with pdfplumber.open(pdf_path) as pdf:
+            for i, page in enumerate(pdf.pages):
+                text = page.extract_text() or ""
+                if text.strip():
+                    all_chunks.extend(split_into_chunks(text, i + 1))
+        print(f"Extracted {len(all_chunks)} chunks from {pdf_path} in {time.perf_counter() - start:.2f} seconds")
+
+    start = time.perf_counter()
+    indexed = dedup_chunks(all_chunks)
+    indexed_time = time.perf_counter() - start
+    print(f"Indexed dedup: {len(indexed)} chunks kept in {indexed_time:.3f} seconds")
+
+    if args.skip_naive:
+        return
+    start = time.perf_counter()
+    naive = _naive_dedup(all_chunks)
+    naive_time = time.perf_counter() - start
+    print(f"Naive dedup:   {len(naive)} chunks kept in {naive_time:.3f} seconds")
+    print(f"Speedup: {naive_time / max(indexed_time, 1e-9):.1f}x, identical output: {naive == indexed}")
+
+
+def synthetic_chunks(count: int, seed: int = 0):
+    """Chunk-shaped strings without going through a PDF."""
+    rng = random.Random(seed)
+    chunks = []
+    for i in range(count):
+        body = " ".join(synthetic_sentence(rng) for _ in range(rng.randint(3, 8)))
+        chunks.append(f"Pg_no {i // 4 + 1}: {body}")
+    return chunks
+
+
+def load_chunks(args):
+    if getattr(args, "pdf", None):
+        from chunker2 import chunk_pdf
+        return chunk_pdf(args.pdf)
+    return synthetic_chunks(args.chunks)
+
+
+def bench_ner(args):
+    import ner_extractor
+    from ner_cache import ner_cache
+
+    chunks = load_chunks(args)
+    # Measure extraction itself, not earlier runs' cached keywords
+    ner_cache.enabled = False
+
+    start = time.perf_counter()
+    per_chunk = {}
+    for chunk in chunks:
+        for kw in ner_extractor.extract_keywords(chunk):
+            per_chunk.setdefault(kw, set()).add(chunk)
+    serial_time = time.perf_counter() - start
+    print(f"Per-chunk nlp(): {len(chunks) / serial_time:.1f} chunks/sec")
+
+    start = time.perf_counter()
+    batched = ner_extractor.map_keywords_to_chunks(chunks, batch_size=args.batch_size, n_process=args.n_process)
+    batched_time = time.perf_counter() - start
+    print(f"nlp.pipe:        {len(chunks) / batched_time:.1f} chunks/sec "
+          f"(batch_size={args.batch_size}, n_process={args.n_process})")
+
+    identical = per_chunk == {kw: set(c) for kw, c in batched.items()}
+    print(f"Speedup: {serial_time / batched_time:.2f}x, identical output: {identical}")
+
+
+def bench_spacy_profiles(args):
+    import ner_extractor
+
+    chunks = load_chunks(args)
+    cleaned = [ner_extractor.clean_text(chunk) for chunk in chunks]
+    results = {}
+    for profile in args.profiles:
+        nlp = ner_extractor.get_nlp(profile)
+        nlp("Warm up.")
+        start = time.perf_counter()
+        per_chunk = [
+            set(ner_extractor.keywords_from_doc(doc, doc.text))
+            for doc in nlp.pipe(cleaned, batch_size=args.batch_size)
+        ]
+        elapsed = time.perf_counter() - start
+        results[profile] = per_chunk
+        print(f"{profile:>5}: {len(chunks) / elapsed:.1f} chunks/sec  ({', '.join(nlp.pipe_names)})")
+
+    reference = args.profiles[0]
+    for profile in args.profiles[1:]:
+        overlaps = []
+        for ref, other in zip(results[reference], results[profile]):
+            union = ref | other
+            overlaps.append(len(ref & other) / len(union) if union else 1.0)
+        ref_all = set().union(*results[reference])
+        other_all = set().union(*results[profile])
+        print(f"{profile} vs {reference}: mean per-chunk Jaccard {sum(overlaps) / len(overlaps):.3f}, "
+              f"vocabulary recall {len(ref_all & other_all) / max(len(ref_all), 1):.3f}, "
+              f"precision {len(ref_all & other_all) / max(len(other_all), 1):.3f}")
+
+
+def _naive_deduplicate_keywords(keywords):
+    """The original any(kw in s ...) scan from ner_extractor, kept as reference."""
+    keywords.sort(key=len, reverse=True)
+    final_keywords = []
+    superstrings = set()
+    for kw in keywords:
+        if not any(kw in s for s in superstrings):
+            final_keywords.append(kw)
+            superstrings.add(kw)
+    return final_keywords
+
+
+def synthetic_keywords(count: int, seed: int = 0):
+    """Multi-word keyword phrases over a pseudo-word vocabulary with many shared substrings."""
+    rng = random.Random(seed)
+    syllables = [w[:3] for w in SYNTHETIC_WORDS] + [w[-3:] for w in SYNTHETIC_WORDS]
+    vocab = sorted({"".join(rng.choice(syllables) for _ in range(rng.randint(1, 3))) for _ in range(5000)})
+    return [" ".join(rng.choice(vocab) for _ in range(rng.randint(1, 4))) for _ in range(count)]
+
+
+def bench_keyword_dedup(args):
+    from ner_extractor import deduplicate_keywords
+
+    for size in args.sizes:
+        keywords = synthetic_keywords(size)
+        start = time.perf_counter()
+        indexed = deduplicate_keywords(list(keywords))
+        indexed_time = time.perf_counter() - start
+        line = f"{size:>7} keywords: automaton {indexed_time:.3f}s ({len(indexed)} kept)"
+        if size <= args.naive_max:
+            start = time.perf_counter()
+            naive = _naive_deduplicate_keywords(list(keywords))
+            naive_time = time.perf_counter() - start
+            line += f", naive {naive_time:.3f}s, identical: {naive == indexed}"
+        print(line)
+
+
+def synthetic_keyword_assignment(chunks, vocabulary: int, per_chunk: int, seed: int = 0):
+    """Zipf-like keyword lists per chunk: a few keywords are in most chunks, most are rare."""
+    rng = random.Random(seed)
+    weights = [1.0 / (rank + 1) for rank in range(vocabulary)]
+    names = [f"keyword {rank}" for rank in range(vocabulary)]
+    return [set(rng.choices(names, weights=weights, k=per_chunk)) for _ in chunks]
+
+
+def bench_postings_memory(args):
+    import tracemalloc
+    from keyword_postings import PostingsBuilder
+
+    chunks = synthetic_chunks(args.chunks)
+    assignment = synthetic_keyword_assignment(chunks, args.vocabulary, args.per_chunk)
+
+    tracemalloc.start()
+    keyword_map = {}
+    for chunk, keywords in zip(chunks, assignment):
+        for kw in keywords:
+            keyword_map.setdefault(kw, set()).add(chunk)
+    old_map = {kw: list(chunk_set) for kw, chunk_set in keyword_map.items()}
+    del keyword_map
+    old_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    tracemalloc.start()
+    builder = PostingsBuilder()
+    for chunk, keywords in zip(chunks, assignment):
+        builder.add_chunk(chunk, keywords)
+    postings = builder.build()
+    new_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    edges = len(postings.indices)
+    print(f"{len(chunks)} chunks, {len(postings)} keywords, {edges} keyword-chunk pairs")
+    print(f"dict[str, list[str]]: {old_bytes / 1e6:.2f} MB")
+    print(f"KeywordPostings:      {new_bytes / 1e6:.2f} MB ({old_bytes / max(new_bytes, 1):.1f}x smaller)")
+    print("(chunk texts are shared by both and not counted)")
+    assert {kw: set(c) for kw, c in old_map.items()} == {kw: set(c) for kw, c in postings.items()}
+
+
+def bench_import_time(args):
+    """Imports a module in a fresh interpreter under -X importtime and reports the slowest imports."""
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {args.module}"],
+        capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    wall = time.perf_counter() - start
+    if result.returncode != 0:
+        print(result.stderr.strip().splitlines()[-1])
+        return
+
+    # importtime lines look like: "import time:  self [us] |  cumulative | imported package"
+    timings = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, self_us, cumulative_us, name = [part.strip() for part in line.replace("import time:", "|", 1).split("|")]
+        timings.append((int(cumulative_us), int(self_us), name))
+
+    print(f"import {args.module}: {wall:.2f}s wall (interpreter start included)")
+    print(f"{'cumulative':>12} {'self':>10}  module")
+    for cumulative_us, self_us, name in sorted(timings, reverse=True)[:args.top]:
+        print(f"{cumulative_us / 1e3:>10.1f}ms {self_us / 1e3:>8.1f}ms  {name.strip()}")
+
+
+# Primary chunk query graph_retriever2 used before PRIMARY_CHUNKS: the
+# keyword/chunk pattern is matched and aggregated twice, once for the top
+# score and once for the chunks tied at it.
+LEGACY_PRIMARY_CHUNKS = """
+    MATCH (k:Keyword {thread_id: $thread_id})-[:APPEARS_IN {thread_id: $thread_id}]->(c:Chunk {thread_id: $thread_id})
+    WHERE k.name IN $keywords
+    WITH c, count(k) AS score
+    ORDER BY score DESC
+    LIMIT 1
+    WITH score AS max_score
+    MATCH (k2:Keyword {thread_id: $thread_id})-[:APPEARS_IN {thread_id: $thread_id}]->(c2:Chunk {thread_id: $thread_id})
+    WHERE k2.name IN $keywords
+    WITH c2, count(k2) AS final_score, max_score
+    WHERE final_score = max_score
+    RETURN c2.id AS id, c2.content AS content
+"""
+
+
+def _db_hits(plan) -> int:
+    return plan.get("dbHits", 0) + sum(_db_hits(child) for child in plan.get("children", []))
+
+
+def bench_scoring_query(args):
+    """PROFILEs the legacy two-pass primary chunk query against PRIMARY_CHUNKS on an existing thread."""
+    from config import NEO4J_DATABASE
+    from graph_retriever2 import PRIMARY_CHUNKS
+    from neo4j_driver import get_driver
+
+    with get_driver().session(database=NEO4J_DATABASE) as session:
+        keywords = args.keywords or [r["name"] for r in session.run("""
+            MATCH (k:Keyword {thread_id: $thread_id})-[:APPEARS_IN]->(:Chunk)
+            WITH k.name AS name, count(*) AS degree
+            ORDER BY degree DESC
+            LIMIT $limit
+            RETURN name
+        """, thread_id=args.thread_id, limit=args.num_keywords)]
+        print(f"thread {args.thread_id}: {len(keywords)} query keywords")
+
+        base = {"thread_id": args.thread_id, "keywords": keywords}
+        runs = [
+            ("two-pass (legacy)", LEGACY_PRIMARY_CHUNKS, base),
+            ("single-pass, count", PRIMARY_CHUNKS, {**base, "weighted": False, "top_k": args.top_k}),
+            ("single-pass, idf", PRIMARY_CHUNKS, {**base, "weighted": True, "top_k": args.top_k}),
+        ]
+        ids = {}
+        print(f"{'query':<20} {'db hits':>10} {'median ms':>10} {'rows':>6}")
+        for label, query, params in runs:
+            result = session.run("PROFILE " + query, params)
+            ids[label] = [r["id"] for r in result]
+            hits = _db_hits(result.consume().profile)
+            times = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                session.run(query, params).consume()
+                times.append(time.perf_counter() - start)
+            times.sort()
+            print(f"{label:<20} {hits:>10} {times[len(times) // 2] * 1e3:>10.2f} {len(ids[label]):>6}")
+
+    legacy, ranked = ids["two-pass (legacy)"], ids["single-pass, count"]
+    # The legacy query returns every chunk tied at the top score; the ranked
+    # query returns them first whenever they fit in top_k
+    if len(legacy) <= args.top_k:
+        print(f"legacy chunks ranked first by the count query: {set(legacy) == set(ranked[:len(legacy)])}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingestion benchmarks")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    dedup = sub.add_parser("dedup", help="indexed vs. pairwise chunk deduplication")
+    dedup.add_argument("--pages", type=int, default=500, help="pages in the synthetic PDF")
+    dedup.add_argument("--pdf", help="benchmark an existing PDF instead of a synthetic one")
+    dedup.add_argument("--skip-naive", action="store_true", help="skip the O(n^2) reference run")
+    dedup.set_defaults(func=bench_dedup)
+
+    ner = sub.add_parser("ner", help="per-chunk nlp() vs. batched nlp.pipe keyword mapping")
+    ner.add_argument("--chunks", type=int, default=500, help="number of synthetic chunks")
+    ner.add_argument("--pdf", help="chunk an existing PDF instead of using synthetic chunks")
+    ner.add_argument("--batch-size", type=int, default=64)
+    ner.add_argument("--n-process", type=int, default=1)
+    ner.set_defaults(func=bench_ner)
+
+    profiles = sub.add_parser("spacy-profiles", help="throughput and keyword overlap of spaCy extraction profiles")
+    profiles.add_argument("--chunks", type=int, default=500, help="number of synthetic chunks")
+    profiles.add_argument("--pdf", help="reference document to chunk instead of synthetic chunks")
+    profiles.add_argument("--profiles", nargs="+", default=["full", "fast"],
+                          help="profiles to run; overlap is measured against the first")
+    profiles.add_argument("--batch-size", type=int, default=64)
+    profiles.set_defaults(func=bench_spacy_profiles)
+
+    kw_dedup = sub.add_parser("keyword-dedup", help="suffix-automaton vs. pairwise keyword deduplication")
+    kw_dedup.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    kw_dedup.add_argument("--naive-max", type=int, default=10000,
+                          help="largest size to also run the quadratic reference on")
+    kw_dedup.set_defaults(func=bench_keyword_dedup)
+
+    postings = sub.add_parser("postings-memory", help="dict-of-lists vs. CSR keyword postings memory")
+    postings.add_argument("--chunks", type=int, default=5000)
+    postings.add_argument("--vocabulary", type=int, default=20000)
+    postings.add_argument("--per-chunk", type=int, default=30, help="keywords drawn per chunk")
+    postings.set_defaults(func=bench_postings_memory)
+
+    import_time = sub.add_parser("import-time", help="cold import time of a backend module")
+    import_time.add_argument("--module", default="API")
+    import_time.add_argument("--top", type=int, default=15, help="slowest imports to list")
+    import_time.set_defaults(func=bench_import_time)
+
+    scoring = sub.add_parser("scoring-query", help="PROFILE db hits of the primary chunk queries (needs Neo4j)")
+    scoring.add_argument("--thread-id", required=True, help="an already ingested thread")
+    scoring.add_argument("--keywords", nargs="+", help="query keywords (default: the thread's most frequent)")
+    scoring.add_argument("--num-keywords", type=int, default=5)
+    scoring.add_argument("--top-k", type=int, default=5)
+    scoring.add_argument("--repeat", type=int, default=20, help="unprofiled runs for the latency median")
+    scoring.set_defaults(func=bench_scoring_query)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,28 +1,35 @@
 # chunker.py
 
 import os
-import nltk
-import pdfplumber
-from nltk.tokenize import sent_tokenize
-from typing import List, Union
+from typing import Iterator, List, Tuple, Union
 import hashlib
 import io
-from config import CHUNKS_PATH, CHUNK_SIZE, CHUNK_OVERLAP
+import re
+import shutil
+import tempfile
+from collections import Counter, defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+from config import CHUNKS_PATH, CHUNK_SIZE, CHUNK_OVERLAP, PDF_EXTRACT_WORKERS, PDF_PAGES_PER_TASK
+from nlp_resources import ensure_nltk_data
 
-# Ensure punkt tokenizer is available
-try:
-    nltk.data.find("tokenizers/punkt")
-except LookupError:
-    nltk.download("punkt")
+# nltk and pdfplumber are imported on first use so importing this module
+# (and the API) stays fast; the punkt data is checked/downloaded then too.
 
-try:
-    nltk.data.find("tokenizers/punkt_tab")
-except LookupError:
-    nltk.download("punkt_tab")
+
+def _sent_tokenize(text: str) -> List[str]:
+    ensure_nltk_data("tokenizers/punkt", "punkt")
+    ensure_nltk_data("tokenizers/punkt_tab", "punkt_tab")
+    from nltk.tokenize import sent_tokenize
+    return sent_tokenize(text)
+
+
+def warm_up():
+    """Loads the punkt tokenizer now instead of on the first upload."""
+    _sent_tokenize("Warm up.")
 
 
 def split_into_chunks(text: str, page_number: int):
-    sentences = sent_tokenize(text)
+    sentences = _sent_tokenize(text)
     chunks = []
     current_chunk = []
     total_len = 0
@@ -36,7 +43,8 @@ def split_into_chunks(text: str, page_number: int):
             chunk_text = f"Pg_no {page_number}: " + " ".join(current_chunk).strip()
             chunks.append({
                 "content": chunk_text,
-                "chunk_id": hashlib.md5(chunk_text.encode()).hexdigest()
+                "chunk_id": hashlib.md5(chunk_text.encode()).hexdigest(),
+                "page": page_number
             })
 
             # Start new chunk with overlap
@@ -55,41 +63,172 @@ def split_into_chunks(text: str, page_number: int):
         chunk_text = f"Pg_no {page_number}: " + " ".join(current_chunk).strip()
         chunks.append({
             "content": chunk_text,
-            "chunk_id": hashlib.md5(chunk_text.encode()).hexdigest()
+            "chunk_id": hashlib.md5(chunk_text.encode()).hexdigest(),
+            "page": page_number
         })
 
     return chunks
 
 
-def chunk_pdf(file_source: Union[str, io.BytesIO]) -> List[str]:
+# Every chunk starts with this prefix, so a chunk can only be contained in
+# chunks whose text includes the same prefix (in practice: the same page).
+PAGE_PREFIX_RE = re.compile(r"Pg_no \d+: ")
+
+
+def dedup_chunks(chunks: List[dict]) -> List[dict]:
+    """
+    Drops every chunk whose content is contained in another chunk.
+
+    Exact duplicates are found by grouping on chunk_id; like the original
+    pairwise scan, every copy of a duplicated chunk is dropped. Containment
+    is only tested against candidates that carry the same "Pg_no N: "
+    prefix and are strictly longer, instead of against every other chunk.
+    """
+    id_counts = Counter(chunk["chunk_id"] for chunk in chunks)
+
+    # prefix -> indexes of chunks whose content includes that prefix
+    prefix_index = defaultdict(list)
+    for idx, chunk in enumerate(chunks):
+        for prefix in set(PAGE_PREFIX_RE.findall(chunk["content"])):
+            prefix_index[prefix].append(idx)
+
+    deduped_chunks = []
+    for i, chunk_i in enumerate(chunks):
+        if id_counts[chunk_i["chunk_id"]] > 1:
+            continue
+
+        content_i = chunk_i["content"]
+        match = PAGE_PREFIX_RE.match(content_i)
+        candidates = prefix_index[match.group(0)] if match else range(len(chunks))
+        is_subset = False
+        for j in candidates:
+            content_j = chunks[j]["content"]
+            if i != j and len(content_j) > len(content_i) and content_i in content_j:
+                is_subset = True
+                break
+        if not is_subset:
+            deduped_chunks.append(chunk_i)
+    return deduped_chunks
+
+
+def _extract_page_range(pdf_path: str, start: int, end: int) -> List[Tuple[int, str]]:
+    """Worker task: extracts the text of pages [start, end) of a PDF on disk."""
+    import pdfplumber
+    page_texts = []
+    with pdfplumber.open(pdf_path) as pdf:
+        for i in range(start, end):
+            page = pdf.pages[i]
+            page_texts.append((i + 1, page.extract_text() or ""))
+            page.close()
+    return page_texts
+
+
+def iter_page_texts(file_source, workers: int = None) -> Iterator[Tuple[int, str]]:
+    """
+    Yields (page_number, text) for every page of a PDF, in page order.
+
+    With workers > 1, page ranges of PDF_PAGES_PER_TASK pages are extracted
+    by a process pool. File-like sources are written to a temporary file
+    once, and every worker opens that file itself, so the PDF bytes are not
+    pickled per task. Results come back in submission order, so page
+    numbers (and therefore chunk prefixes and chunk_ids) stay deterministic.
+    At most two tasks per worker are in flight, so extracted text never
+    piles up ahead of a slow consumer.
+    """
+    import pdfplumber
+    workers = PDF_EXTRACT_WORKERS if workers is None else workers
+
+    if workers <= 1:
+        with pdfplumber.open(file_source) as pdf:
+            for i, page in enumerate(pdf.pages):
+                text = page.extract_text() or ""
+                # Release pdfplumber's cached layout objects for this page
+                page.close()
+                yield i + 1, text
+        return
+
+    temp_path = None
+    if isinstance(file_source, str):
+        pdf_path = file_source
+    else:
+        file_source.seek(0)
+        with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as tmp:
+            shutil.copyfileobj(file_source, tmp)
+            temp_path = pdf_path = tmp.name
+
+    try:
+        with pdfplumber.open(pdf_path) as pdf:
+            page_count = len(pdf.pages)
+        pages_per_task = max(1, PDF_PAGES_PER_TASK)
+        starts = range(0, page_count, pages_per_task)
+        workers = min(workers, max(1, len(starts)))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            pending = deque()
+            for start in starts:
+                pending.append(executor.submit(
+                    _extract_page_range, pdf_path, start, min(start + pages_per_task, page_count)
+                ))
+                if len(pending) >= 2 * workers:
+                    yield from pending.popleft().result()
+            while pending:
+                yield from pending.popleft().result()
+    finally:
+        if temp_path:
+            os.remove(temp_path)
+
+
+def iter_pdf_chunks(file_source, workers: int = None) -> Iterator[str]:
+    """
+    Streaming variant of chunk_pdf: yields chunk contents page by page.
+    Accepts a file path or any seekable file-like object.
+
+    Only one page's text and chunks are held at a time, and deduplication
+    is page-local. Every chunk carries its "Pg_no N: " prefix, so chunks
+    from different pages practically never contain one another.
+    Nothing is written to CHUNKS_PATH.
+    """
+    for page_number, text in iter_page_texts(file_source, workers):
+        if text.strip():
+            for chunk in dedup_chunks(split_into_chunks(text, page_number)):
+                yield chunk["content"]
+
+
+class ChunkStream:
+    """
+    Re-iterable wrapper around iter_pdf_chunks that counts the chunks it
+    yields, so callers consuming the stream still know the total afterwards.
+    """
+
+    def __init__(self, file_source):
+        self.file_source = file_source
+        self.count = 0
+
+    def __iter__(self) -> Iterator[str]:
+        self.count = 0
+        if hasattr(self.file_source, "seek"):
+            self.file_source.seek(0)
+        for chunk in iter_pdf_chunks(self.file_source):
+            self.count += 1
+            yield chunk
+
+
+def chunk_pdf(file_source: Union[str, io.BytesIO], workers: int = None) -> List[str]:
     """
     Extract and chunk PDF pages.
     Accepts either a file path (str) or an in-memory file-like object (BytesIO).
     Saves chunks to CHUNKS_PATH for debugging, but main return is in-memory list.
+    Page text extraction runs on `workers` processes (default PDF_EXTRACT_WORKERS).
     """
     all_chunks = []
 
     # Open PDF (works with both path and BytesIO)
-    with pdfplumber.open(file_source) as pdf:
-        for i, page in enumerate(pdf.pages):
-            text = page.extract_text() or ""
-            if text.strip():
-                page_chunks = split_into_chunks(text, i + 1)
-                all_chunks.extend(page_chunks)
+    for page_number, text in iter_page_texts(file_source, workers):
+        if text.strip():
+            page_chunks = split_into_chunks(text, page_number)
+            all_chunks.extend(page_chunks)
 
     # Deduplicate chunks on the same page
-    deduped_chunks = []
-    for i, chunk_i in enumerate(all_chunks):
-        content_i = chunk_i["content"]
-        is_subset = False
-        for j, chunk_j in enumerate(all_chunks):
-            if i != j:
-                content_j = chunk_j["content"]
-                if content_i in content_j:
-                    is_subset = True
-                    break
-        if not is_subset:
-            deduped_chunks.append(chunk_i)
+    deduped_chunks = dedup_chunks(all_chunks)
 
     # Save to disk (optional debug)
     os.makedirs(os.path.dirname(CHUNKS_PATH), exist_ok=True)
@@ -24,6 +24,30 @@ CHUNKS_PATH = os.getenv("CHUNKS_PATH") or os.path.join(DATA_DIR, "chunks.txt")
 # === Chunking Config ===
 CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "600"))
 CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "150"))
+# Stream uploads page by page through chunking and NER instead of
+# materializing the whole chunk list (bounded memory for very large PDFs)
+STREAM_CHUNKING = os.getenv("STREAM_CHUNKING", "false").lower() == "true"
+# Processes used for PDF text extraction (1 = extract serially in-process)
+PDF_EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", "1"))
+PDF_PAGES_PER_TASK = max(1, int(os.getenv("PDF_PAGES_PER_TASK", "16")))  # pages handed to a worker at a time
+
+# === NER Config ===
+NER_BATCH_SIZE = int(os.getenv("NER_BATCH_SIZE", "64"))  # chunks per nlp.pipe batch
+NER_N_PROCESS = int(os.getenv("NER_N_PROCESS", "1"))     # spaCy worker processes
+CANDIDATE_MEMO_SIZE = int(os.getenv("CANDIDATE_MEMO_SIZE", "50000"))  # memoized keyword normalizations
+DATE_MEMO_SIZE = int(os.getenv("DATE_MEMO_SIZE", "10000"))  # memoized dateutil results per DATE entity text
+# Persistent keywords-per-chunk cache, keyed by chunk_id and extractor version
+NER_CACHE_ENABLED = os.getenv("NER_CACHE_ENABLED", "true").lower() == "true"
+NER_CACHE_PATH = os.getenv("NER_CACHE_PATH") or os.path.join(DATA_DIR, "ner_cache.db")
+
+# spaCy pipeline profile for keyword extraction: "full" (dependency parser
+# noun chunks) or "fast" (no parser, rule-based sentences, POS-run phrases)
+SPACY_PROFILE = os.getenv("SPACY_PROFILE", "full").lower()
+# Never download NLTK data at runtime; missing corpora raise instead
+NLP_OFFLINE = os.getenv("NLP_OFFLINE", "false").lower() == "true"
+# Load the spaCy model and NLTK data in a background thread at API startup
+# instead of on the first upload
+NLP_WARMUP_ON_STARTUP = os.getenv("NLP_WARMUP_ON_STARTUP", "false").lower() == "true"
 
 # === Keyword Filtering ===
 # Define the percentage threshold. Keywords appearing in more than this
@@ -31,19 +55,83 @@ CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "150"))
 # A good starting point is between 0.15 (15%) and 0.30 (30%).
 FREQUENCY_THRESHOLD = float(os.getenv("FREQUENCY_THRESHOLD", "0.03"))  # 3%
 
+# "prevalence" applies the threshold above, "top_n" keeps only keywords that
+# are among the KEYWORDS_PER_CHUNK highest-IDF keywords of some chunk, and
+# "both" applies the threshold first, then top_n
+KEYWORD_FILTER_MODE = os.getenv("KEYWORD_FILTER_MODE", "prevalence").lower()
+KEYWORDS_PER_CHUNK = int(os.getenv("KEYWORDS_PER_CHUNK", "15"))
+
+# Spool keywords to disk during NER and find the generic ones with a
+# count-min sketch (DF_SKETCH_DEPTH x DF_SKETCH_WIDTH counters) instead of
+# holding every posting list in memory; results match the exact filter
+KEYWORD_FILTER_STREAMING = os.getenv("KEYWORD_FILTER_STREAMING", "false").lower() == "true"
+DF_SKETCH_WIDTH = int(os.getenv("DF_SKETCH_WIDTH", "65536"))  # counters per sketch row
+DF_SKETCH_DEPTH = int(os.getenv("DF_SKETCH_DEPTH", "4"))      # sketch rows (hash functions)
+
 # Define a set of essential keywords to protect from filtering,
 # even if they are very frequent.
 KEEP_LIST = {}
 
+# === Ingestion Cache ===
+# Chunks and filtered keyword maps of previously seen uploads, keyed by the
+# SHA-256 of the PDF plus the chunking/filter settings above
+INGEST_CACHE_ENABLED = os.getenv("INGEST_CACHE_ENABLED", "true").lower() == "true"
+INGEST_CACHE_DIR = os.getenv("INGEST_CACHE_DIR") or os.path.join(DATA_DIR, "ingest_cache")
+INGEST_CACHE_MAX_MB = int(os.getenv("INGEST_CACHE_MAX_MB", "512"))
+
 # === Neo4j settings ===
 NEO4J_URI = os.getenv("NEO4J_URI", "bolt://localhost:7687")
 NEO4J_USER = os.getenv("NEO4J_USER", "neo4j")
 NEO4J_PASSWORD = os.getenv("NEO4J_PASSWORD", "hello-world") # <-- CORRECTED PASSWORD
 NEO4J_DATABASE = os.getenv("NEO4J_DATABASE", "neo4j")
+NEO4J_MAX_POOL_SIZE = int(os.getenv("NEO4J_MAX_POOL_SIZE", "50"))  # connections per shared driver
+NEO4J_ACQUISITION_TIMEOUT = float(os.getenv("NEO4J_ACQUISITION_TIMEOUT", "30"))  # seconds to wait for a pooled connection
+
+# --- Graph Build Settings ---
+# "neo4j" stores graphs in Neo4j; "memory" keeps each thread's graph as
+# sparse matrices in local files (memory_graph.py), no database server needed
+GRAPH_BACKEND = os.getenv("GRAPH_BACKEND", "neo4j").lower()
+MEMORY_GRAPH_DIR = os.getenv("MEMORY_GRAPH_DIR") or os.path.join(DATA_DIR, "memory_graph")
+MEMORY_GRAPH_CACHE_SIZE = int(os.getenv("MEMORY_GRAPH_CACHE_SIZE", "16"))  # loaded thread graphs kept
+GRAPH_BATCH_SIZE = int(os.getenv("GRAPH_BATCH_SIZE", "1000"))  # rows per UNWIND batch / write transaction
+GRAPH_DELETE_BATCH_SIZE = int(os.getenv("GRAPH_DELETE_BATCH_SIZE", "10000"))  # nodes/relationships per clear_graph transaction
+# "rebuild" clears a thread's graph and rebuilds it on every upload;
+# "incremental" diffs against Neo4j and writes only what changed
+GRAPH_SYNC_MODE = os.getenv("GRAPH_SYNC_MODE", "rebuild").lower()
+
+# --- Keyword Similarity (SIMILAR_TO edges) ---
+SIMILARITY_EDGES_ENABLED = os.getenv("SIMILARITY_EDGES_ENABLED", "true").lower() == "true"
+SIMILARITY_THRESHOLD = float(os.getenv("SIMILARITY_THRESHOLD", "0.5"))  # min character-trigram Jaccard
+SIMILARITY_TOP_K = int(os.getenv("SIMILARITY_TOP_K", "5"))              # max SIMILAR_TO edges per keyword
+SIMILARITY_NUM_PERM = int(os.getenv("SIMILARITY_NUM_PERM", "64"))       # MinHash permutations
+SIMILARITY_BANDS = int(os.getenv("SIMILARITY_BANDS", "21"))             # LSH bands (num_perm / bands rows each)
+SIMILARITY_MAX_BUCKET = int(os.getenv("SIMILARITY_MAX_BUCKET", "200"))  # LSH bucket members paired
 
 # --- Retrieval Settings ---
 TOP_K_KEYWORDS = int(os.getenv("TOP_K_KEYWORDS", "1"))      # number of top keyword matches
 MAX_DEPTH = int(os.getenv("MAX_DEPTH", "1"))               # maximum graph depth for chunk expansion
+PRIMARY_TOP_K = int(os.getenv("PRIMARY_TOP_K", "5"))       # best-scoring chunks retrieved before expansion
+PRIMARY_WEIGHTING = os.getenv("PRIMARY_WEIGHTING", "idf").lower()  # "idf" (sum of keyword IDF) or "count"
+# "iterative" runs one query per depth and returns every neighbor; "bounded"
+# runs a single capped query (see GraphRetriever.expand_bounded)
+EXPANSION_MODE = os.getenv("EXPANSION_MODE", "iterative").lower()
+EXPANSION_PER_KEYWORD = int(os.getenv("EXPANSION_PER_KEYWORD", "25"))  # chunks followed per keyword per hop
+EXPANSION_MAX_CHUNKS = int(os.getenv("EXPANSION_MAX_CHUNKS", "40"))    # neighbor chunks kept in total
+VOCAB_CACHE_MAX_KEYWORDS = int(os.getenv("VOCAB_CACHE_MAX_KEYWORDS", "500000"))  # keyword names cached across threads
+
+# --- Lexical Keyword Preselection ---
+# "off" sends the whole vocabulary to Gemini; "prefilter" sends only the
+# LEXICAL_TOP_N best lexical matches once the vocabulary has at least
+# LEXICAL_MIN_VOCAB keywords; "local" also skips Gemini when the query
+# spells out keywords confidently (score >= LEXICAL_CONFIDENT_SCORE).
+# Off by default: lexical candidates cannot surface synonym-only matches
+LEXICAL_MODE = os.getenv("LEXICAL_MODE", "off").lower()
+LEXICAL_TOP_N = int(os.getenv("LEXICAL_TOP_N", "200"))
+LEXICAL_MIN_VOCAB = int(os.getenv("LEXICAL_MIN_VOCAB", "300"))
+LEXICAL_CONFIDENT_SCORE = float(os.getenv("LEXICAL_CONFIDENT_SCORE", "0.95"))
+LEXICAL_LOCAL_MAX = int(os.getenv("LEXICAL_LOCAL_MAX", "10"))  # keywords used without Gemini
+LEXICAL_INDEX_DIR = os.getenv("LEXICAL_INDEX_DIR") or os.path.join(DATA_DIR, "lexical_index")
+LEXICAL_INDEX_CACHE_SIZE = int(os.getenv("LEXICAL_INDEX_CACHE_SIZE", "32"))  # loaded thread indexes kept
 
 # === Reranker Config ===
 ENABLE_RERANKING = os.getenv("ENABLE_RERANKING", "false").lower() == "true"
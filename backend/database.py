@@ -76,6 +76,10 @@ class DB:
         result = self.cursor.fetchone()
         return result[0] if result else None
 
+    def get_thread_ids(self, user_id):
+        self.cursor.execute('SELECT thread_id FROM threads WHERE user_id = ?', (user_id,))
+        return [row[0] for row in self.cursor.fetchall()]
+
     def update_status(self, thread_id, status):
         self.cursor.execute('''
         UPDATE threads SET status = ?, updated_at = CURRENT_TIMESTAMP WHERE thread_id = ?
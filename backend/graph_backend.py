@@ -0,0 +1,22 @@
+# graph_backend.py
+
+from config import GRAPH_BACKEND, NEO4J_URI, NEO4J_USER, NEO4J_PASSWORD, NEO4J_DATABASE
+
+
+def create_graph_builder():
+    """KnowledgeGraphBuilder for the configured GRAPH_BACKEND ("neo4j" or "memory")."""
+    if GRAPH_BACKEND == "memory":
+        # Imported here so the Neo4j backend never needs SciPy
+        from memory_graph import MemoryGraphBuilder
+        return MemoryGraphBuilder()
+    from graph_builder2 import KnowledgeGraphBuilder
+    return KnowledgeGraphBuilder()
+
+
+def create_graph_retriever(thread_id: str):
+    """GraphRetriever for `thread_id` on the configured GRAPH_BACKEND."""
+    if GRAPH_BACKEND == "memory":
+        from memory_graph import MemoryGraphRetriever
+        return MemoryGraphRetriever(thread_id=thread_id)
+    from graph_retriever2 import GraphRetriever
+    return GraphRetriever(NEO4J_URI, NEO4J_USER, NEO4J_PASSWORD, NEO4J_DATABASE, thread_id)
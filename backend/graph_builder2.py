@@ -1,80 +1,427 @@
 # graph_builder.py
 
-from neo4j import GraphDatabase
-from typing import List, Dict
+import time
+import uuid
+from typing import List, Dict, Iterator, Optional, Tuple
 from config import (
     NEO4J_URI,
     NEO4J_USER,
     NEO4J_PASSWORD,
     NEO4J_DATABASE,
+    GRAPH_BATCH_SIZE,
+    GRAPH_DELETE_BATCH_SIZE,
+    SIMILARITY_EDGES_ENABLED,
+    LEXICAL_MODE,
 )
+from graph_schema import ensure_schema, schema_status
+from keyword_postings import KeywordPostings
+from keyword_similarity import similarity_rows
+from lexical_index import LexicalIndex
+
+
+def _batched(rows: List[dict], batch_size: int) -> Iterator[List[dict]]:
+    """Yields consecutive slices of at most batch_size rows."""
+    for start in range(0, len(rows), batch_size):
+        yield rows[start:start + batch_size]
+
+
+def _same_weight(old, new) -> bool:
+    if old is None or new is None:
+        return old is new
+    return abs(old - new) <= 1e-9
+
+
+UPSERT_CHUNKS = """
+    UNWIND $rows AS row
+    MERGE (c:Chunk {id: row.id, thread_id: $thread_id})
+    SET c.content = row.content
+"""
+
+# Keywords store their document frequency; IDF also depends on the
+# thread's chunk count (ThreadMeta.total_chunks) and is computed at query
+# time, so a sync only rewrites keywords whose df changed
+UPSERT_KEYWORDS = """
+    UNWIND $rows AS row
+    MERGE (k:Keyword {name: row.name, thread_id: $thread_id})
+    SET k.df = row.df
+    REMOVE k.idf
+"""
+
+UPSERT_EDGES = """
+    UNWIND $rows AS row
+    MATCH (k:Keyword {name: row.kw_name, thread_id: $thread_id})
+    MATCH (c:Chunk {id: row.c_id, thread_id: $thread_id})
+    MERGE (k)-[:APPEARS_IN {thread_id: $thread_id}]->(c)
+"""
+
+UPSERT_SIMILAR = """
+    UNWIND $rows AS row
+    MATCH (a:Keyword {name: row.a, thread_id: $thread_id})
+    MATCH (b:Keyword {name: row.b, thread_id: $thread_id})
+    MERGE (a)-[r:SIMILAR_TO {thread_id: $thread_id}]->(b)
+    SET r.score = row.score
+"""
+
+DELETE_SIMILAR = """
+    UNWIND $rows AS row
+    MATCH (a:Keyword {name: row.a, thread_id: $thread_id})-[r:SIMILAR_TO {thread_id: $thread_id}]->(b:Keyword {name: row.b, thread_id: $thread_id})
+    DELETE r
+"""
+
+DELETE_EDGES = """
+    UNWIND $rows AS row
+    MATCH (k:Keyword {name: row.kw_name, thread_id: $thread_id})-[r:APPEARS_IN {thread_id: $thread_id}]->(c:Chunk {id: row.c_id, thread_id: $thread_id})
+    DELETE r
+"""
+
+DELETE_CHUNKS = """
+    UNWIND $rows AS row
+    MATCH (c:Chunk {id: row.id, thread_id: $thread_id})
+    DETACH DELETE c
+"""
+
+DELETE_KEYWORDS = """
+    UNWIND $rows AS row
+    MATCH (k:Keyword {name: row.name, thread_id: $thread_id})
+    DETACH DELETE k
+"""
+
+
+# clear_graph steps: (count query, delete-one-batch query). Relationships go
+# first so node deletes never detach large fan-outs, and every pattern is
+# served by a thread_id index from graph_schema.
+CLEAR_STEPS = {
+    "APPEARS_IN": (
+        "MATCH ()-[r:APPEARS_IN {thread_id: $thread_id}]->() RETURN count(r) AS total",
+        "MATCH ()-[r:APPEARS_IN {thread_id: $thread_id}]->() WITH r LIMIT $limit DELETE r RETURN count(*) AS deleted",
+    ),
+    "SIMILAR_TO": (
+        "MATCH ()-[r:SIMILAR_TO {thread_id: $thread_id}]->() RETURN count(r) AS total",
+        "MATCH ()-[r:SIMILAR_TO {thread_id: $thread_id}]->() WITH r LIMIT $limit DELETE r RETURN count(*) AS deleted",
+    ),
+    "Chunk": (
+        "MATCH (c:Chunk {thread_id: $thread_id}) RETURN count(c) AS total",
+        "MATCH (c:Chunk {thread_id: $thread_id}) WITH c LIMIT $limit DETACH DELETE c RETURN count(*) AS deleted",
+    ),
+    "Keyword": (
+        "MATCH (k:Keyword {thread_id: $thread_id}) RETURN count(k) AS total",
+        "MATCH (k:Keyword {thread_id: $thread_id}) WITH k LIMIT $limit DETACH DELETE k RETURN count(*) AS deleted",
+    ),
+}
+
+
+# Each thread's graph carries a version stamp on a (:ThreadMeta) node that
+# changes on every build, sync or clear, so in-process caches of thread data
+# (see graph_retriever2.VocabularyCache) know exactly when to drop entries.
+BUMP_VERSION = """
+    MERGE (m:ThreadMeta {thread_id: $thread_id})
+    SET m.version = $version, m.updated_at = timestamp(), m.total_chunks = $total_chunks
+"""
 
 
 class KnowledgeGraphBuilder:
-    def __init__(self, uri=NEO4J_URI, user=NEO4J_USER, password=NEO4J_PASSWORD, database=NEO4J_DATABASE):
-        self.driver = GraphDatabase.driver(uri, auth=(user, password))
+    def __init__(self, uri=NEO4J_URI, user=NEO4J_USER, password=NEO4J_PASSWORD, database=NEO4J_DATABASE,
+                 batch_size: int = GRAPH_BATCH_SIZE, delete_batch_size: int = GRAPH_DELETE_BATCH_SIZE,
+                 similarity_edges: bool = SIMILARITY_EDGES_ENABLED):
+        # Imported here so memory_graph's subclass runs without the Neo4j driver
+        from neo4j_driver import get_driver
+        # Shared, process-wide driver: building a builder costs no new connection pool
+        self.driver = get_driver(uri, user, password, database)
         self.database = database
+        self.batch_size = max(1, batch_size)
+        self.delete_batch_size = max(1, delete_batch_size)
+        self.similarity_edges = similarity_edges
+        ensure_schema(self.driver, uri, database)
 
     def close(self):
-        self.driver.close()
+        """Kept for callers; the shared driver stays open (see neo4j_driver.close_all)."""
+        self.driver = None
+
+    def schema_status(self):
+        """Returns the state of the Keyword/Chunk/APPEARS_IN lookup indexes."""
+        return schema_status(self.driver, self.database)
 
-    def clear_graph(self, thread_id: str):
+    def clear_graph(self, thread_id: str, batch_size: int = None, drop_version: bool = False) -> Dict[str, int]:
         """
         Clears only the graph data belonging to a specific thread_id.
+
+        Relationships and then nodes are deleted label by label through the
+        thread_id indexes, `batch_size` (GRAPH_DELETE_BATCH_SIZE) at a time,
+        each batch in its own write transaction, so large threads never
+        build one huge transaction. Returns the number deleted per step.
+
+        The thread's version stamp is bumped, or removed with drop_version
+        when the thread itself is going away.
         """
+        batch_size = batch_size or self.delete_batch_size
         print(f"🧹 Clearing graph for thread_id={thread_id}...")
+        deleted = {}
+        clear_start = time.perf_counter()
         with self.driver.session(database=self.database) as session:
-            session.run("MATCH (n {thread_id: $thread_id}) DETACH DELETE n", thread_id=thread_id)
-        print(f"✅ Cleared graph for thread_id={thread_id}")
+            for step, (count_query, delete_query) in CLEAR_STEPS.items():
+                total = session.run(count_query, thread_id=thread_id).single()["total"]
+                deleted[step] = 0
+                while deleted[step] < total:
+                    removed = session.execute_write(self._delete_batch, delete_query, thread_id, batch_size)
+                    if not removed:
+                        break
+                    deleted[step] += removed
+                    print(f"  - {step}: deleted {deleted[step]}/{total}")
+            if drop_version:
+                session.run("MATCH (m:ThreadMeta {thread_id: $thread_id}) DELETE m", thread_id=thread_id).consume()
+            else:
+                self._bump_version(session, thread_id, None)
+        LexicalIndex.remove(thread_id)
+        print(f"✅ Cleared graph for thread_id={thread_id} in {time.perf_counter() - clear_start:.2f} seconds "
+              f"({', '.join(f'{n} {step}' for step, n in deleted.items())})")
+        return deleted
+
+    def clear_threads(self, thread_ids: List[str]) -> Dict[str, Dict[str, int]]:
+        """Clears the graphs of several threads, e.g. every thread of a deleted user."""
+        return {thread_id: self.clear_graph(thread_id, drop_version=True) for thread_id in thread_ids}
+
+    def _bump_version(self, session, thread_id: str, total_chunks: Optional[int]) -> str:
+        """New version stamp for the thread, recording its chunk count (None once cleared)."""
+        version = uuid.uuid4().hex
+        session.execute_write(lambda tx: tx.run(
+            BUMP_VERSION, thread_id=thread_id, version=version, total_chunks=total_chunks
+        ).consume())
+        return version
+
+    @staticmethod
+    def _save_lexical_index(thread_id: str, keywords: List[str], version: str) -> float:
+        """
+        Builds and persists the thread's lexical keyword index (see
+        lexical_index.py) under the new version stamp. A failure only costs
+        a rebuild on the next query, so it is logged and not raised.
+        """
+        if LEXICAL_MODE == "off":
+            return 0.0
+        phase_start = time.perf_counter()
+        try:
+            LexicalIndex.build(keywords, version).save(thread_id)
+        except Exception as e:
+            print(f"Warning: Failed to save lexical index for thread_id={thread_id}: {e}")
+        return time.perf_counter() - phase_start
+
+    @staticmethod
+    def _delete_batch(tx, query: str, thread_id: str, limit: int) -> int:
+        return tx.run(query, thread_id=thread_id, limit=limit).single()["deleted"]
+
+    @staticmethod
+    def _write_batch(tx, query: str, rows: List[dict], thread_id: str):
+        tx.run(query, rows=rows, thread_id=thread_id).consume()
+
+    def _write_rows(self, session, query: str, rows: List[dict], thread_id: str) -> int:
+        """
+        Sends rows to Neo4j as `UNWIND $rows` batches, one explicit write
+        transaction per batch. Returns the number of batches written.
+        """
+        batches = 0
+        for batch in _batched(rows, self.batch_size):
+            session.execute_write(self._write_batch, query, batch, thread_id)
+            batches += 1
+        return batches
 
-    def build_graph_from_map(self, keyword_to_chunks_map: Dict[str, List[str]], thread_id: str):
+    @staticmethod
+    def _graph_rows(keyword_to_chunks_map: KeywordPostings) -> Tuple[List[dict], List[dict], List[dict]]:
+        """Chunk, Keyword and APPEARS_IN rows for a postings map, keyed by stable chunk ids."""
+        all_keywords = keyword_to_chunks_map.keys()
+        chunk_table = keyword_to_chunks_map.chunks
+        chunk_keys = {c: keyword_to_chunks_map.chunk_key(c) for c in keyword_to_chunks_map.used_chunk_ids()}
+
+        chunk_rows = [{"id": key, "content": chunk_table[c]} for c, key in chunk_keys.items()]
+        keyword_rows = [
+            {"name": kw, "df": keyword_to_chunks_map.document_frequency(k)}
+            for k, kw in enumerate(all_keywords)
+        ]
+        edge_rows = [
+            {"kw_name": kw, "c_id": chunk_keys[c]}
+            for k, kw in enumerate(all_keywords)
+            for c in keyword_to_chunks_map.chunk_ids(k)
+        ]
+        return chunk_rows, keyword_rows, edge_rows
+
+    def build_graph_from_map(self, keyword_to_chunks_map: KeywordPostings, thread_id: str) -> Dict[str, float]:
         """
-        Builds a knowledge graph from a map of keywords to chunks.
+        Builds a knowledge graph from keyword -> chunk posting lists.
         All nodes and relationships are tagged with thread_id.
+        Chunk node ids are the chunks' MD5 chunk_ids (stable across uploads),
+        Keyword nodes carry their document frequency as `df` and ThreadMeta
+        the thread's chunk count, from which retrieval computes IDF. Unless disabled, keywords with similar spellings are linked
+        by scored SIMILAR_TO relationships (see keyword_similarity).
+
+        Nodes and relationships are written in batches of `self.batch_size`
+        rows per transaction. Returns the wall time of each phase in seconds.
         """
         print(f"Building graph for thread_id={thread_id} with {len(keyword_to_chunks_map)} keywords...")
+        timings = {}
+        build_start = time.perf_counter()
 
         # --- 1. Extract unique chunks and keywords ---
-        all_keywords = list(keyword_to_chunks_map.keys())
-        unique_chunks_set = set(chunk for chunks in keyword_to_chunks_map.values() for chunk in chunks)
-        all_chunks = list(unique_chunks_set)
-        chunk_to_id = {chunk: i for i, chunk in enumerate(all_chunks)}
+        chunk_rows, keyword_rows, edge_rows = self._graph_rows(keyword_to_chunks_map)
+        timings["prepare"] = time.perf_counter() - build_start
 
         # --- 2. Push nodes and relationships to Neo4j ---
         with self.driver.session(database=self.database) as session:
             # Create Chunk nodes
-            print("Creating Chunk nodes...")
-            for i, chunk in enumerate(all_chunks):
-                session.run(
-                    """
-                    MERGE (c:Chunk {id: $id, thread_id: $thread_id})
-                    SET c.content = $content
-                    """,
-                    id=i, content=chunk, thread_id=thread_id
-                )
+            print(f"Creating {len(chunk_rows)} Chunk nodes...")
+            phase_start = time.perf_counter()
+            batches = self._write_rows(session, UPSERT_CHUNKS, chunk_rows, thread_id)
+            timings["chunks"] = time.perf_counter() - phase_start
+            print(f"  - {batches} batches in {timings['chunks']:.2f} seconds")
 
             # Create Keyword nodes
-            print("Creating Keyword nodes...")
-            for kw in all_keywords:
-                session.run(
-                    """
-                    MERGE (k:Keyword {name: $name, thread_id: $thread_id})
-                    """,
-                    name=kw, thread_id=thread_id
-                )
+            print(f"Creating {len(keyword_rows)} Keyword nodes...")
+            phase_start = time.perf_counter()
+            batches = self._write_rows(session, UPSERT_KEYWORDS, keyword_rows, thread_id)
+            timings["keywords"] = time.perf_counter() - phase_start
+            print(f"  - {batches} batches in {timings['keywords']:.2f} seconds")
 
             # Create APPEARS_IN relationships
-            print("Creating APPEARS_IN relationships...")
-            for kw, chunks in keyword_to_chunks_map.items():
-                for chunk in chunks:
-                    chunk_id = chunk_to_id[chunk]
-                    session.run(
-                        """
-                        MATCH (k:Keyword {name: $kw_name, thread_id: $thread_id})
-                        MATCH (c:Chunk {id: $c_id, thread_id: $thread_id})
-                        MERGE (k)-[:APPEARS_IN {thread_id: $thread_id}]->(c)
-                        """,
-                        kw_name=kw, c_id=chunk_id, thread_id=thread_id
-                    )
-
-        print(f"✅ Graph built for thread_id={thread_id} with {len(all_chunks)} chunks and {len(all_keywords)} keywords.")
+            print(f"Creating {len(edge_rows)} APPEARS_IN relationships...")
+            phase_start = time.perf_counter()
+            batches = self._write_rows(session, UPSERT_EDGES, edge_rows, thread_id)
+            timings["relationships"] = time.perf_counter() - phase_start
+            print(f"  - {batches} batches in {timings['relationships']:.2f} seconds")
+
+            # Create SIMILAR_TO relationships between near-duplicate keywords
+            if self.similarity_edges:
+                similar_rows, timings["similarity"] = similarity_rows(keyword_to_chunks_map.keys())
+                print(f"Creating {len(similar_rows)} SIMILAR_TO relationships "
+                      f"(computed in {timings['similarity']:.2f} seconds)...")
+                phase_start = time.perf_counter()
+                batches = self._write_rows(session, UPSERT_SIMILAR, similar_rows, thread_id)
+                timings["similar_to"] = time.perf_counter() - phase_start
+                print(f"  - {batches} batches in {timings['similar_to']:.2f} seconds")
+
+            version = self._bump_version(session, thread_id, keyword_to_chunks_map.total_chunks)
+
+        timings["lexical_index"] = self._save_lexical_index(thread_id, keyword_to_chunks_map.keys(), version)
+        timings["total"] = time.perf_counter() - build_start
+        print(f"✅ Graph built for thread_id={thread_id} with {len(chunk_rows)} chunks and {len(keyword_rows)} keywords "
+              f"in {timings['total']:.2f} seconds.")
+        return timings
+
+    def sync_graph_from_map(self, keyword_to_chunks_map: KeywordPostings, thread_id: str) -> Dict:
+        """
+        Incrementally brings a thread's graph in line with new posting lists:
+        reads the thread's current chunk ids, keywords and APPEARS_IN edges,
+        and writes only the difference. Because chunk ids are content hashes,
+        re-uploading a document with one amended page only touches that
+        page's chunks and their edges.
+
+        Returns a diff summary (added/removed/updated counts) with the wall
+        time of each phase under "timings".
+        """
+        print(f"Syncing graph for thread_id={thread_id} with {len(keyword_to_chunks_map)} keywords...")
+        timings = {}
+        sync_start = time.perf_counter()
+        chunk_rows, keyword_rows, edge_rows = self._graph_rows(keyword_to_chunks_map)
+
+        with self.driver.session(database=self.database) as session:
+            # --- 1. Read what the thread currently holds ---
+            existing_chunks = {
+                r["id"] for r in session.run(
+                    "MATCH (c:Chunk {thread_id: $thread_id}) RETURN c.id AS id", thread_id=thread_id)
+            }
+            existing_keywords = {
+                r["name"]: r["df"] for r in session.run(
+                    "MATCH (k:Keyword {thread_id: $thread_id}) RETURN k.name AS name, k.df AS df",
+                    thread_id=thread_id)
+            }
+            existing_edges = {
+                (r["name"], r["id"]) for r in session.run("""
+                    MATCH (k:Keyword {thread_id: $thread_id})-[:APPEARS_IN {thread_id: $thread_id}]->(c:Chunk {thread_id: $thread_id})
+                    RETURN k.name AS name, c.id AS id
+                    """, thread_id=thread_id)
+            }
+            meta = session.run("MATCH (m:ThreadMeta {thread_id: $thread_id}) RETURN m.total_chunks AS total",
+                               thread_id=thread_id).single()
+            existing_total = meta["total"] if meta else None
+            existing_similar = {}
+            if self.similarity_edges:
+                existing_similar = {
+                    (r["a"], r["b"]): r["score"] for r in session.run("""
+                        MATCH (a:Keyword {thread_id: $thread_id})-[r:SIMILAR_TO {thread_id: $thread_id}]->(b:Keyword {thread_id: $thread_id})
+                        RETURN a.name AS a, b.name AS b, r.score AS score
+                        """, thread_id=thread_id)
+                }
+            timings["read"] = time.perf_counter() - sync_start
+
+            # --- 2. Diff ---
+            phase_start = time.perf_counter()
+            new_chunk_ids = {row["id"] for row in chunk_rows}
+            added_chunks = [row for row in chunk_rows if row["id"] not in existing_chunks]
+            removed_chunks = existing_chunks - new_chunk_ids
+
+            new_keywords = {row["name"] for row in keyword_rows}
+            added_keywords = [row for row in keyword_rows if row["name"] not in existing_keywords]
+            updated_keywords = [
+                row for row in keyword_rows
+                if row["name"] in existing_keywords and existing_keywords[row["name"]] != row["df"]
+            ]
+            removed_keywords = existing_keywords.keys() - new_keywords
+
+            new_edges = {(row["kw_name"], row["c_id"]) for row in edge_rows}
+            added_edges = [row for row in edge_rows if (row["kw_name"], row["c_id"]) not in existing_edges]
+            # Edges of removed nodes go away with DETACH DELETE
+            removed_edges = [
+                {"kw_name": name, "c_id": c_id} for name, c_id in existing_edges - new_edges
+                if name not in removed_keywords and c_id not in removed_chunks
+            ]
+
+            added_similar, removed_similar = [], []
+            if self.similarity_edges:
+                similar_rows, timings["similarity"] = similarity_rows(keyword_to_chunks_map.keys())
+                new_similar = {(row["a"], row["b"]) for row in similar_rows}
+                added_similar = [
+                    row for row in similar_rows
+                    if not _same_weight(existing_similar.get((row["a"], row["b"])), row["score"])
+                ]
+                removed_similar = [
+                    {"a": a, "b": b} for a, b in existing_similar.keys() - new_similar
+                    if a not in removed_keywords and b not in removed_keywords
+                ]
+            timings["diff"] = time.perf_counter() - phase_start
+
+            # --- 3. Write only the difference ---
+            phase_start = time.perf_counter()
+            self._write_rows(session, DELETE_EDGES, removed_edges, thread_id)
+            self._write_rows(session, DELETE_SIMILAR, removed_similar, thread_id)
+            self._write_rows(session, DELETE_CHUNKS, [{"id": c_id} for c_id in removed_chunks], thread_id)
+            self._write_rows(session, DELETE_KEYWORDS, [{"name": name} for name in removed_keywords], thread_id)
+            self._write_rows(session, UPSERT_CHUNKS, added_chunks, thread_id)
+            self._write_rows(session, UPSERT_KEYWORDS, added_keywords + updated_keywords, thread_id)
+            self._write_rows(session, UPSERT_EDGES, added_edges, thread_id)
+            self._write_rows(session, UPSERT_SIMILAR, added_similar, thread_id)
+            total_chunks = keyword_to_chunks_map.total_chunks
+            if any((removed_edges, removed_similar, removed_chunks, removed_keywords, added_chunks,
+                    added_keywords, updated_keywords, added_edges, added_similar)) \
+                    or existing_total != total_chunks:
+                version = self._bump_version(session, thread_id, total_chunks)
+                timings["lexical_index"] = self._save_lexical_index(thread_id, keyword_to_chunks_map.keys(), version)
+            timings["write"] = time.perf_counter() - phase_start
+
+        timings["total"] = time.perf_counter() - sync_start
+        summary = {
+            "chunks_added": len(added_chunks),
+            "chunks_removed": len(removed_chunks),
+            "chunks_unchanged": len(chunk_rows) - len(added_chunks),
+            "keywords_added": len(added_keywords),
+            "keywords_removed": len(removed_keywords),
+            "keywords_updated": len(updated_keywords),
+            "edges_added": len(added_edges),
+            "edges_removed": len(existing_edges - new_edges),
+            "similar_added": len(added_similar),
+            "similar_removed": len(removed_similar),
+            "timings": timings,
+        }
+        print(f"✅ Graph synced for thread_id={thread_id} in {timings['total']:.2f} seconds: "
+              f"chunks +{summary['chunks_added']}/-{summary['chunks_removed']} "
+              f"({summary['chunks_unchanged']} unchanged), "
+              f"keywords +{summary['keywords_added']}/-{summary['keywords_removed']} "
+              f"({summary['keywords_updated']} with a new df), "
+              f"APPEARS_IN +{summary['edges_added']}/-{summary['edges_removed']}, "
+              f"SIMILAR_TO +{summary['similar_added']}/-{summary['similar_removed']}")
+        return summary
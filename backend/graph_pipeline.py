@@ -9,9 +9,9 @@ from mock_email_service import send_email
 from database import db_session
 from mock_insurance_db import insurance_credentials_db  
 import google.generativeai as genai
-from graph_retriever2 import GraphRetriever
+from graph_backend import create_graph_retriever
 from gemini_client import generate_answer   # <-- make sure you have your answer generator here
-from config import NEO4J_URI, NEO4J_USER, NEO4J_PASSWORD, NEO4J_DATABASE, GEMINI_API_KEY
+from config import GEMINI_API_KEY
 
 
 genai.configure(api_key=GEMINI_API_KEY)
@@ -107,8 +107,8 @@ def handle_explanation(state: GraphState) -> GraphState:
 
         print(f"[handle_explanation] Running RAG for thread_id={thread_id} | query='{user_query}'")
 
-        # --- 1️⃣ Retrieve from Neo4j using thread_id ---
-        retriever = GraphRetriever(NEO4J_URI, NEO4J_USER, NEO4J_PASSWORD, NEO4J_DATABASE, thread_id)
+        # --- 1️⃣ Retrieve from the graph backend using thread_id ---
+        retriever = create_graph_retriever(thread_id)
         retrieved_chunks = retriever.retrieve(user_query)
         retriever.close()
 
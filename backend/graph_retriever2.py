@@ -1,35 +1,259 @@
-from neo4j import GraphDatabase
-from config import MAX_DEPTH
-from gemini_client import extract_keywords  # wrapper for Gemini API
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from config import (
+    MAX_DEPTH,
+    VOCAB_CACHE_MAX_KEYWORDS,
+    LEXICAL_MODE,
+    LEXICAL_MIN_VOCAB,
+    PRIMARY_TOP_K,
+    PRIMARY_WEIGHTING,
+    EXPANSION_MODE,
+    EXPANSION_PER_KEYWORD,
+    EXPANSION_MAX_CHUNKS,
+)
+from graph_schema import ensure_schema, schema_status
+from lexical_index import lexical_indexes
+
+# Primary chunks in one aggregation: each matched keyword contributes its
+# IDF, ln((1 + N) / (1 + df)) + 1 with N the thread's chunk count from
+# ThreadMeta (keyword_filter.idf_weights; graphs that stored no df fall back
+# to a stored idf, then 1.0, as does $weighted false), and the top $top_k
+# chunks are returned with their scores. Keyword lookups seek the
+# (name, thread_id) index; APPEARS_IN edges only ever join nodes of the same
+# thread, so the edge and chunk need no thread_id filter of their own, and
+# chunk content is read only for the rows that survive the LIMIT.
+PRIMARY_CHUNKS = """
+    OPTIONAL MATCH (m:ThreadMeta {thread_id: $thread_id})
+    WITH m.total_chunks AS total
+    UNWIND $keywords AS name
+    MATCH (k:Keyword {name: name, thread_id: $thread_id})
+    WITH k, CASE
+        WHEN NOT $weighted THEN 1.0
+        WHEN total IS NOT NULL AND k.df IS NOT NULL THEN log((1.0 + total) / (1.0 + k.df)) + 1.0
+        ELSE coalesce(k.idf, 1.0)
+    END AS weight
+    MATCH (k)-[:APPEARS_IN]->(c:Chunk)
+    WITH c, sum(weight) AS score, count(k) AS matched
+    ORDER BY score DESC, matched DESC, c.id
+    LIMIT $top_k
+    RETURN c.id AS id, c.content AS content, score, matched
+"""
+
+# One hop of bounded expansion: chunks reached from the frontier through a
+# shared keyword or a SIMILAR_TO neighbor (the bounded *0..1 hop). Chunks
+# already visited are excluded first; then every keyword contributes at most
+# $per_keyword new chunks (lowest ids first) and the hop keeps at most
+# $max_chunks, ranked by how many keywords link them to the frontier. Only
+# ids are returned.
+EXPANSION_HOP = """
+    CALL {
+        WITH visited, frontier
+        UNWIND frontier AS c_id
+        MATCH (:Chunk {id: c_id, thread_id: $thread_id})<-[:APPEARS_IN]-(:Keyword)-[:SIMILAR_TO*0..1]-(k:Keyword)
+        WITH DISTINCT visited, k
+        CALL {
+            WITH visited, k
+            MATCH (k)-[:APPEARS_IN]->(n:Chunk)
+            WHERE NOT n.id IN visited
+            WITH n.id AS n_id
+            ORDER BY n_id
+            LIMIT $per_keyword
+            RETURN n_id
+        }
+        WITH n_id, count(*) AS links
+        ORDER BY links DESC, n_id
+        LIMIT $max_chunks
+        RETURN collect(n_id) AS found, collect(links) AS found_links
+    }
+    WITH visited + found AS visited, found AS frontier, depth + 1 AS depth,
+         hits + [i IN range(0, size(found) - 1) | {id: found[i], links: found_links[i], depth: depth + 1}] AS hits
+"""
+
+CHUNK_CONTENT = """
+    UNWIND $ids AS c_id
+    MATCH (c:Chunk {id: c_id, thread_id: $thread_id})
+    RETURN c.id AS id, c.content AS content
+"""
+
+
+def expansion_query(depth: int) -> str:
+    """All `depth` expansion hops chained into one statement (one round trip)."""
+    return (
+        "WITH $seeds AS visited, $seeds AS frontier, [] AS hits, 0 AS depth"
+        + EXPANSION_HOP * depth
+        + "RETURN hits"
+    )
+
+
+class VocabularyCache:
+    """
+    Process-wide LRU of each thread's keyword names, tagged with the
+    thread's ThreadMeta version stamp. KnowledgeGraphBuilder bumps the stamp
+    on every build, sync and clear, so an entry is used only while it
+    matches the graph exactly. Memory is bounded by the total number of
+    cached keywords across threads.
+    """
+
+    def __init__(self, max_keywords: int = VOCAB_CACHE_MAX_KEYWORDS):
+        self.max_keywords = max_keywords
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, thread_id: str, version: Optional[str]) -> Optional[List[str]]:
+        with self._lock:
+            entry = self._entries.get(thread_id)
+            if entry is not None and version is not None and entry[0] == version:
+                self._entries.move_to_end(thread_id)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            return None
+
+    def put(self, thread_id: str, version: Optional[str], keywords: List[str]):
+        if version is None or len(keywords) > self.max_keywords:
+            # Unversioned (pre-stamp) graphs cannot be invalidated, so they are not cached
+            return
+        with self._lock:
+            old = self._entries.pop(thread_id, None)
+            if old is not None:
+                self._size -= len(old[1])
+            self._entries[thread_id] = (version, keywords)
+            self._size += len(keywords)
+            while self._size > self.max_keywords:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+                self.evictions += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "threads": len(self._entries),
+                "keywords": self._size,
+                "max_keywords": self.max_keywords,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+vocabulary_cache = VocabularyCache()
 
 
 class GraphRetriever:
     def __init__(self, neo4j_uri, neo4j_user, neo4j_pass, neo4j_db, thread_id: str):
-        self.driver = GraphDatabase.driver(neo4j_uri, auth=(neo4j_user, neo4j_pass))
+        # Imported here (as is the Gemini client) so memory_graph's subclass needs neither SDK
+        from neo4j_driver import get_driver
+        # Shared, process-wide driver: a retriever per chat turn opens no new pool
+        self.driver = get_driver(neo4j_uri, neo4j_user, neo4j_pass, neo4j_db)
         self.database = neo4j_db
         self.thread_id = thread_id
+        ensure_schema(self.driver, neo4j_uri, neo4j_db)
 
     def close(self):
-        self.driver.close()
+        """Kept for callers; the shared driver stays open (see neo4j_driver.close_all)."""
+        self.driver = None
 
-    def get_keywords_for_thread(self, thread_id: str):
+    def schema_status(self):
+        """Returns the state of the Keyword/Chunk/APPEARS_IN lookup indexes."""
+        return schema_status(self.driver, self.database)
+
+    def get_graph_version(self, thread_id: str) -> Optional[str]:
+        """The thread's ThreadMeta version stamp (None for graphs built before stamping)."""
+        with self.driver.session(database=self.database) as session:
+            record = session.run("""
+                MATCH (m:ThreadMeta {thread_id: $thread_id})
+                RETURN m.version AS version
+            """, {"thread_id": thread_id}).single()
+            return record["version"] if record else None
+
+    def get_vocabulary(self, thread_id: str) -> Tuple[Optional[str], List[str]]:
         """
-        Retrieve all Keyword node names for a specific thread_id.
+        The thread's version stamp and all its Keyword node names.
+        Served from the process-wide vocabulary cache while the version
+        stamp is unchanged; only a one-node lookup hits Neo4j then.
         """
+        # Read the stamp first: if the graph changes during the scan below,
+        # the entry is stored under the older stamp and refetched next time
+        version = self.get_graph_version(thread_id)
+        cached = vocabulary_cache.get(thread_id, version)
+        if cached is not None:
+            return version, cached
+
         with self.driver.session(database=self.database) as session:
             result = session.run("""
                 MATCH (k:Keyword {thread_id: $thread_id})
                 RETURN DISTINCT k.name AS name
             """, {"thread_id": thread_id})
-            return [r["name"] for r in result]
-        
+            keywords = [r["name"] for r in result]
+        vocabulary_cache.put(thread_id, version, keywords)
+        return version, keywords
+
+    def get_keywords_for_thread(self, thread_id: str):
+        """Retrieve all Keyword node names for a specific thread_id."""
+        return self.get_vocabulary(thread_id)[1]
+
+    def select_keywords(self, query: str) -> List[str]:
+        """
+        Picks the graph keywords that match the query.
+
+        With LEXICAL_MODE "off" Gemini sees the thread's whole vocabulary.
+        Otherwise the thread's lexical index narrows it first: Gemini only
+        sees the top LEXICAL_TOP_N lexical candidates (the whole vocabulary
+        while it has fewer than LEXICAL_MIN_VOCAB keywords), and in "local"
+        mode keywords the query spells out are used without calling Gemini.
+        """
+        from gemini_client import extract_keywords  # wrapper for Gemini API
+        version, graph_keywords = self.get_vocabulary(self.thread_id)
+        if LEXICAL_MODE == "off" or not graph_keywords:
+            return extract_keywords(query, graph_keywords)
+
+        start = time.perf_counter()
+        index = lexical_indexes.get(self.thread_id, version, graph_keywords)
+        matches = index.search(query)
+        elapsed = time.perf_counter() - start
+
+        if LEXICAL_MODE == "local" and matches["confident"]:
+            print(f"Lexical index matched {len(matches['confident'])} keywords locally "
+                  f"in {elapsed * 1000:.1f} ms; skipping Gemini")
+            return matches["confident"]
+
+        if len(graph_keywords) < LEXICAL_MIN_VOCAB or not matches["candidates"]:
+            return extract_keywords(query, graph_keywords)
+        print(f"Lexical index sent {len(matches['candidates'])}/{len(graph_keywords)} keywords "
+              f"to Gemini (selected in {elapsed * 1000:.1f} ms)")
+        return extract_keywords(query, matches["candidates"])
+
+    def primary_chunks(self, keywords: List[str], top_k: int = PRIMARY_TOP_K) -> List[Dict]:
+        """
+        The `top_k` chunks sharing the most (IDF-weighted, see
+        PRIMARY_WEIGHTING) keywords with `keywords`, best first, as
+        {"id", "content", "score", "matched"}.
+        """
+        with self.driver.session(database=self.database) as session:
+            result = session.run(PRIMARY_CHUNKS, {
+                "keywords": list(dict.fromkeys(keywords)),
+                "thread_id": self.thread_id,
+                "weighted": PRIMARY_WEIGHTING == "idf",
+                "top_k": top_k,
+            })
+            return [
+                {"id": r["id"], "content": r["content"], "score": r["score"], "matched": r["matched"]}
+                for r in result
+            ]
+
     # --- Core Retrieval ---
     def retrieve(self, query: str):
-        # ✅ 1. Fetch all keywords for this thread from Neo4j
-        graph_keywords = self.get_keywords_for_thread(self.thread_id)
-
-        # ✅ 2. Extract query-specific keywords via Gemini using available graph keywords
-        query_keywords = extract_keywords(query, graph_keywords)
+        # ✅ 1-2. Extract query-specific keywords from this thread's graph keywords
+        query_keywords = self.select_keywords(query)
         print(f'Extracted keywords: {query_keywords}')
         if not query_keywords:
             print("⚠ No keywords extracted from query")
@@ -41,35 +265,30 @@ class GraphRetriever:
             return []
 
         # 3. Retrieve primary chunks connected to matched keywords (scored)
-        with self.driver.session(database=self.database) as session:
-            result = session.run("""
-                // Part 1: Calculate score per chunk
-                MATCH (k:Keyword {thread_id: $thread_id})-[:APPEARS_IN {thread_id: $thread_id}]->(c:Chunk {thread_id: $thread_id})
-                WHERE k.name IN $keywords
-                WITH c, count(k) AS score
-                ORDER BY score DESC
-                LIMIT 1
-                WITH score AS max_score
-
-                // Part 2: Get all chunks with same top score
-                MATCH (k2:Keyword {thread_id: $thread_id})-[:APPEARS_IN {thread_id: $thread_id}]->(c2:Chunk {thread_id: $thread_id})
-                WHERE k2.name IN $keywords
-                WITH c2, count(k2) AS final_score, max_score
-                WHERE final_score = max_score
-                RETURN c2.id AS id, c2.content AS content
-            """, {
-                "keywords": matched_keywords,
-                "thread_id": self.thread_id
-            })
-            
-            primary_chunks = [{"id": r["id"], "content": r["content"]} for r in result]
+        primary_chunks = self.primary_chunks(matched_keywords)
 
         # 4. Expand neighborhood up to MAX_DEPTH
-        retrieved_chunks = primary_chunks.copy()
+        start = time.perf_counter()
+        neighbors = self.expand_neighbors(primary_chunks)
+        print(f"Expansion ({EXPANSION_MODE}) added {len(neighbors)} chunks "
+              f"({sum(len(n['content'] or '') for n in neighbors)} chars) "
+              f"in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+        return primary_chunks + neighbors
+
+    def expand_neighbors(self, primary_chunks: List[Dict]) -> List[Dict]:
+        """Neighbor chunks of the primary chunks, new ones only, per EXPANSION_MODE."""
+        if EXPANSION_MODE == "bounded":
+            return self.expand_bounded(primary_chunks)
+        return self.expand_iterative(primary_chunks)
+
+    def expand_iterative(self, primary_chunks: List[Dict], max_depth: int = MAX_DEPTH) -> List[Dict]:
+        """Breadth-first expansion, one UNION query (with content) per depth."""
+        retrieved_chunks = []
         visited = set([c["id"] for c in primary_chunks])
         frontier = [c["id"] for c in primary_chunks]
 
-        for depth in range(MAX_DEPTH):
+        for depth in range(max_depth):
             if not frontier:
                 break
             with self.driver.session(database=self.database) as session:
@@ -91,4 +310,35 @@ class GraphRetriever:
             visited.update([n["id"] for n in neighbors])
             frontier = [n["id"] for n in neighbors]
 
-        return retrieved_chunks
\ No newline at end of file
+        return retrieved_chunks
+
+    def expand_bounded(self, primary_chunks: List[Dict], max_depth: int = MAX_DEPTH,
+                       per_keyword: int = EXPANSION_PER_KEYWORD,
+                       max_chunks: int = EXPANSION_MAX_CHUNKS) -> List[Dict]:
+        """
+        Expansion in a single query with fan-out caps: every hop takes at
+        most `per_keyword` not yet visited chunks per keyword and
+        `max_chunks` chunks, and only ids come back. The `max_chunks`
+        neighbors ranked best (nearest first, then most linking keywords)
+        then have their content fetched.
+        """
+        seeds = [c["id"] for c in primary_chunks]
+        if not seeds or max_depth < 1:
+            return []
+        with self.driver.session(database=self.database) as session:
+            record = session.run(expansion_query(max_depth), {
+                "seeds": seeds,
+                "thread_id": self.thread_id,
+                "per_keyword": per_keyword,
+                "max_chunks": max_chunks,
+            }).single()
+            hits = sorted(record["hits"], key=lambda h: (h["depth"], -h["links"], h["id"]))[:max_chunks]
+            if not hits:
+                return []
+            content = {
+                r["id"]: r["content"]
+                for r in session.run(CHUNK_CONTENT, {"ids": [h["id"] for h in hits], "thread_id": self.thread_id})
+            }
+        per_depth = [sum(1 for h in hits if h["depth"] == d) for d in range(1, max_depth + 1)]
+        print(f"Bounded expansion kept {len(hits)} of {len(record['hits'])} chunk ids (per depth: {per_depth})")
+        return [{"id": h["id"], "content": content.get(h["id"])} for h in hits]
@@ -0,0 +1,59 @@
+# graph_schema.py
+
+import threading
+from typing import Dict, List
+
+# Every statement in graph_builder2 / graph_retriever2 filters on these keys.
+# Range indexes are used rather than node-key constraints so the schema also
+# works on Neo4j Community edition.
+SCHEMA_INDEXES = {
+    "keyword_name_thread": "CREATE INDEX keyword_name_thread IF NOT EXISTS FOR (k:Keyword) ON (k.name, k.thread_id)",
+    "keyword_thread": "CREATE INDEX keyword_thread IF NOT EXISTS FOR (k:Keyword) ON (k.thread_id)",
+    "chunk_id_thread": "CREATE INDEX chunk_id_thread IF NOT EXISTS FOR (c:Chunk) ON (c.id, c.thread_id)",
+    "chunk_thread": "CREATE INDEX chunk_thread IF NOT EXISTS FOR (c:Chunk) ON (c.thread_id)",
+    "appears_in_thread": "CREATE INDEX appears_in_thread IF NOT EXISTS FOR ()-[r:APPEARS_IN]-() ON (r.thread_id)",
+    "thread_meta_thread": "CREATE INDEX thread_meta_thread IF NOT EXISTS FOR (m:ThreadMeta) ON (m.thread_id)",
+    "similar_to_thread": "CREATE INDEX similar_to_thread IF NOT EXISTS FOR ()-[r:SIMILAR_TO]-() ON (r.thread_id)",
+}
+
+_ensured = set()
+_ensured_lock = threading.Lock()
+
+
+def ensure_schema(driver, uri: str, database: str, force: bool = False) -> bool:
+    """
+    Creates the indexes in SCHEMA_INDEXES if they do not exist yet.
+
+    Every statement is idempotent (IF NOT EXISTS), and the work is done at
+    most once per process for each server/database pair unless force=True.
+    Returns True if the statements were sent to the server.
+    """
+    key = (uri, database)
+    with _ensured_lock:
+        if key in _ensured and not force:
+            return False
+        with driver.session(database=database) as session:
+            for statement in SCHEMA_INDEXES.values():
+                session.run(statement).consume()
+        _ensured.add(key)
+    return True
+
+
+def schema_status(driver, database: str) -> List[Dict]:
+    """
+    Reports the state of the indexes in SCHEMA_INDEXES.
+    Indexes that are missing on the server are reported with state 'MISSING'.
+    """
+    with driver.session(database=database) as session:
+        result = session.run("""
+            SHOW INDEXES
+            YIELD name, state, populationPercent, type, entityType, labelsOrTypes, properties
+            WHERE name IN $names
+            RETURN name, state, populationPercent, type, entityType, labelsOrTypes, properties
+        """, names=list(SCHEMA_INDEXES))
+        found = {r["name"]: dict(r) for r in result}
+
+    return [
+        found.get(name, {"name": name, "state": "MISSING", "populationPercent": 0.0})
+        for name in SCHEMA_INDEXES
+    ]
@@ -0,0 +1,148 @@
+# ingest_cache.py
+
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from typing import Dict, Optional
+
+from config import (
+    INGEST_CACHE_DIR,
+    INGEST_CACHE_ENABLED,
+    INGEST_CACHE_MAX_MB,
+    CHUNK_SIZE,
+    CHUNK_OVERLAP,
+    FREQUENCY_THRESHOLD,
+    KEEP_LIST,
+    KEYWORD_FILTER_MODE,
+    KEYWORDS_PER_CHUNK,
+    SPACY_PROFILE,
+    STREAM_CHUNKING,
+)
+from keyword_postings import KeywordPostings
+from ner_extractor import extractor_version
+
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def hash_upload(file_obj) -> str:
+    """SHA-256 of a seekable file-like object, read in blocks and rewound afterwards."""
+    file_obj.seek(0)
+    digest = hashlib.sha256()
+    for block in iter(lambda: file_obj.read(HASH_BLOCK_SIZE), b""):
+        digest.update(block)
+    file_obj.seek(0)
+    return digest.hexdigest()
+
+
+def config_fingerprint() -> str:
+    """
+    The chunking/extraction/filter settings that change what an upload
+    ingests to, including the extractor version (spaCy, model, pipes and
+    rules). Streaming chunking dedups per page, global chunking across the
+    whole document, so the two can produce different chunks.
+    """
+    return (f"size={CHUNK_SIZE};overlap={CHUNK_OVERLAP};stream={STREAM_CHUNKING};profile={SPACY_PROFILE};"
+            f"extractor={extractor_version()};"
+            f"threshold={FREQUENCY_THRESHOLD};mode={KEYWORD_FILTER_MODE};per_chunk={KEYWORDS_PER_CHUNK};"
+            f"keep={sorted(KEEP_LIST)}")
+
+
+class IngestCache:
+    """
+    On-disk cache of ingestion artifacts, keyed by the SHA-256 of the uploaded
+    PDF plus the chunking/filter config. Each entry is a gzipped JSON file
+    holding the chunk count and the filtered keyword->chunk postings (which
+    carry the chunk texts themselves).
+
+    Entries are touched on every hit, and the least recently used ones are
+    evicted once the directory grows past max_bytes.
+    """
+
+    def __init__(self, cache_dir: str = INGEST_CACHE_DIR, max_bytes: int = INGEST_CACHE_MAX_MB * 1024 * 1024,
+                 enabled: bool = INGEST_CACHE_ENABLED):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    def key(self, pdf_sha256: str) -> str:
+        return hashlib.sha256(f"{pdf_sha256}|{config_fingerprint()}".encode()).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json.gz")
+
+    def get(self, pdf_sha256: str) -> Optional[Dict]:
+        """
+        Returns the cached artifacts for an upload, or None on a miss.
+        "filtered_map" is returned as KeywordPostings.
+        """
+        if not self.enabled:
+            return None
+        path = self._path(self.key(pdf_sha256))
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                entry = json.load(f)
+            entry["filtered_map"] = KeywordPostings.from_dict(entry["filtered_map"])
+            os.utime(path)  # mark as most recently used
+        except (OSError, ValueError, KeyError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return entry
+
+    def put(self, pdf_sha256: str, filtered_map: KeywordPostings, chunk_count: int):
+        """Stores the artifacts for an upload and evicts old entries if over budget."""
+        if not self.enabled:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        entry = {"chunk_count": chunk_count, "filtered_map": filtered_map.to_dict()}
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        with os.fdopen(fd, "wb") as raw, gzip.open(raw, "wt", encoding="utf-8") as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, self._path(self.key(pdf_sha256)))
+        self._evict()
+
+    def _evict(self):
+        with self._lock:
+            entries = []
+            for name in os.listdir(self.cache_dir):
+                if not name.endswith(".json.gz"):
+                    continue
+                path = os.path.join(self.cache_dir, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+                self.evictions += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+ingest_cache = IngestCache()
@@ -1,73 +1,224 @@
-from typing import Dict, List, Set
+from array import array
+from typing import Iterable
+
+import numpy as np
 
 # --- Configuration ---
-from config import FREQUENCY_THRESHOLD, KEEP_LIST
+from config import (
+    FREQUENCY_THRESHOLD,
+    KEEP_LIST,
+    KEYWORD_FILTER_MODE,
+    KEYWORDS_PER_CHUNK,
+    DF_SKETCH_WIDTH,
+    DF_SKETCH_DEPTH,
+)
+from keyword_postings import KeywordPostings, SpooledPostingsBuilder
+
+FILTER_MODES = {"prevalence", "top_n", "both"}
+
+
+def document_frequencies(key_chunk_map: KeywordPostings) -> np.ndarray:
+    """Document frequency of every keyword, straight from the CSR row pointers."""
+    return np.diff(np.asarray(key_chunk_map.indptr, dtype=np.int64))
+
+
+def idf_weights(document_frequency: np.ndarray, total_chunks: int) -> np.ndarray:
+    """Smoothed inverse document frequency: ln((1 + N) / (1 + df)) + 1."""
+    return np.log((1 + total_chunks) / (1 + document_frequency)) + 1.0
+
+
+def top_n_per_chunk(key_chunk_map: KeywordPostings, weights: np.ndarray, n: int) -> np.ndarray:
+    """
+    Mask of keywords that rank among the n highest-weighted keywords of at
+    least one chunk (ties broken by keyword order).
+    """
+    document_frequency = document_frequencies(key_chunk_map)
+    edge_keywords = np.repeat(np.arange(len(key_chunk_map)), document_frequency)
+    edge_chunks = np.asarray(key_chunk_map.indices, dtype=np.int64)
+    # Group edges by chunk, best weight first within each chunk
+    order = np.lexsort((edge_keywords, -weights[edge_keywords], edge_chunks))
+    sorted_chunks = edge_chunks[order]
+    group_starts = np.flatnonzero(np.r_[True, sorted_chunks[1:] != sorted_chunks[:-1]])
+    group_sizes = np.diff(np.r_[group_starts, len(sorted_chunks)])
+    rank = np.arange(len(sorted_chunks)) - np.repeat(group_starts, group_sizes)
+    keep = np.zeros(len(key_chunk_map), dtype=bool)
+    keep[edge_keywords[order][rank < n]] = True
+    return keep
+
 
 def filter_keys(
-    key_chunk_map: Dict[str, List[str]],
-    total_chunks: int
-) -> Dict[str, List[str]]:
+    key_chunk_map: KeywordPostings,
+    total_chunks: int,
+    mode: str = KEYWORD_FILTER_MODE,
+    keywords_per_chunk: int = KEYWORDS_PER_CHUNK,
+) -> KeywordPostings:
 
     """
     Filters a keyword-to-chunk map based on document frequency.
 
     Removes keywords that are too common (appear in a high percentage of chunks)
-    while protecting essential keywords specified in a keep_list.
+    while protecting essential keywords specified in a keep_list. Document
+    frequencies are computed for all keywords in one NumPy pass.
 
     Args:
-        key_chunk_map: Dictionary mapping keywords to a list of chunks they appear in.
+        key_chunk_map: Keyword -> chunk-id posting lists (output of map_keywords_to_chunks).
         total_chunks: The total number of chunks in the dataset.
-        threshold: The frequency threshold (e.g., 0.20 for 20%). Keywords
-                   appearing in more chunks than this will be removed.
-        keep_list: A set of keywords to always keep, regardless of their frequency.
+        mode: "prevalence" drops keywords found in more than FREQUENCY_THRESHOLD
+              of chunks; "top_n" keeps only keywords among the
+              `keywords_per_chunk` highest-IDF keywords of some chunk;
+              "both" applies the prevalence cut, then top_n.
+        keywords_per_chunk: N for the top_n mode.
 
     Returns:
-        A new dictionary containing only the filtered, specific keywords.
+        New posting lists containing only the filtered, specific keywords,
+        with their IDF weights in `.idf`.
     """
+    if mode not in FILTER_MODES:
+        raise ValueError(f"Unknown KEYWORD_FILTER_MODE '{mode}', expected one of {sorted(FILTER_MODES)}")
     threshold = FREQUENCY_THRESHOLD
     keep_list = KEEP_LIST
-
-    filtered_map = {}
-    removed_keywords = []
+    keywords = key_chunk_map.keys()
 
     print(f"\n--- Starting Frequency Filtering ---")
     print(f"Original number of unique keywords: {len(key_chunk_map)}")
     print(f"Total chunks: {total_chunks}")
+    print(f"Mode: {mode}")
     print(f"Frequency threshold: {threshold:.0%}")
+    if mode != "prevalence":
+        print(f"Keywords per chunk: {keywords_per_chunk}")
     print(f"Protected keywords: {keep_list}\n")
 
-    for keyword, chunks in key_chunk_map.items():
-        # The number of chunks a keyword is in IS its document frequency
-        document_frequency = len(chunks)
-        prevalence = document_frequency / total_chunks
+    # The number of chunks a keyword is in IS its document frequency
+    document_frequency = document_frequencies(key_chunk_map)
+    prevalence = document_frequency / max(total_chunks, 1)
+    weights = idf_weights(document_frequency, total_chunks)
+    weighted_map = KeywordPostings(key_chunk_map.chunks, keywords, key_chunk_map.indptr, key_chunk_map.indices,
+                                   key_chunk_map.total_chunks, array("d", weights.tolist()))
 
+    keep = np.ones(len(key_chunk_map), dtype=bool)
+    if mode in ("prevalence", "both"):
+        # Keep the keyword if its prevalence is below or equal to the threshold
+        keep &= prevalence <= threshold
+    if mode in ("top_n", "both"):
+        # Rank only among the keywords that survived the prevalence cut
+        survivors = np.flatnonzero(keep)
+        candidates = weighted_map if len(survivors) == len(keep) else weighted_map.select(survivors.tolist())
+        candidate_keep = top_n_per_chunk(candidates, np.asarray(candidates.idf), keywords_per_chunk)
+        keep[survivors[~candidate_keep]] = False
+    if keep_list:
         # Keep the keyword if it's in the protected list
-        if keyword in keep_list:
-            filtered_map[keyword] = chunks
-            continue
+        keep |= np.fromiter((kw in keep_list for kw in keywords), dtype=bool, count=len(keywords))
 
-        # Keep the keyword if its prevalence is below or equal to the threshold
-        if prevalence <= threshold:
-            filtered_map[keyword] = chunks
-        else:
-            # Otherwise, it's too generic, so we track it for removal
-            removed_keywords.append((keyword, prevalence))
+    filtered_map = weighted_map.select(np.flatnonzero(keep).tolist())
 
     # --- Reporting ---
+    removed = np.flatnonzero(~keep)
     print(f"Filtering complete.")
     print(f"Kept {len(filtered_map)} specific keywords.")
-    print(f"Removed {len(removed_keywords)} generic keywords.\n")
+    print(f"Removed {len(removed)} generic keywords.\n")
 
     # Sort removed keywords by prevalence to see the most common ones first
-    removed_keywords.sort(key=lambda item: item[1], reverse=True)
-    
+    top_removed = removed[np.argsort(-prevalence[removed], kind="stable")[:10]]
     print("Top 10 most frequent (and removed) keywords:")
-    for kw, prevalence in removed_keywords[:10]:
-        print(f"- '{kw}' (found in {prevalence:.1%} of chunks)")
+    for k in top_removed:
+        print(f"- '{keywords[k]}' (found in {prevalence[k]:.1%} of chunks)")
 
     return filtered_map
 
 
+
+class StreamingDocumentFrequency:
+    """
+    Upper bounds on keyword document frequencies in fixed memory: a
+    count-min sketch of `depth` rows of `width` counters, fed one chunk at a
+    time while chunks flow out of NER. Counters use conservative update
+    (only those at the current minimum are raised), which keeps the
+    over-count small. Memory does not depend on the vocabulary size.
+    """
+
+    def __init__(self, width: int = DF_SKETCH_WIDTH, depth: int = DF_SKETCH_DEPTH):
+        self.width = width
+        self.depth = depth
+        self._rows = [array("I", bytes(4 * width)) for _ in range(depth)]
+
+    def _cells(self, keyword: str):
+        # Double hashing: row i uses h1 + i * h2
+        h1 = hash(keyword)
+        h2 = hash((keyword, "df")) | 1
+        return [(h1 + i * h2) % self.width for i in range(self.depth)]
+
+    def add_chunk(self, keywords: Iterable[str]):
+        """Counts one chunk; each of its distinct keywords gains one document."""
+        rows = self._rows
+        for keyword in set(keywords):
+            cells = self._cells(keyword)
+            count = min(row[cell] for row, cell in zip(rows, cells)) + 1
+            for row, cell in zip(rows, cells):
+                if row[cell] < count:
+                    row[cell] = count
+
+    def estimate(self, keyword: str) -> int:
+        """Upper bound on the number of chunks containing keyword."""
+        return min(row[cell] for row, cell in zip(self._rows, self._cells(keyword)))
+
+    def memory_bytes(self) -> int:
+        return 4 * self.width * self.depth
+
+
+def filter_keys_streaming(
+    postings: SpooledPostingsBuilder,
+    document_frequency: StreamingDocumentFrequency,
+    mode: str = KEYWORD_FILTER_MODE,
+    keywords_per_chunk: int = KEYWORDS_PER_CHUNK,
+) -> KeywordPostings:
+    """
+    filter_keys for keywords spooled during NER, without ever holding the
+    posting lists of generic keywords.
+
+    `document_frequency` was fed by `postings` as chunks came out of NER.
+    Once the total is known, every keyword whose upper bound is within the
+    prevalence threshold is settled as specific; only the rest are counted
+    exactly, in one pass over the spool, so that pass holds at most the
+    possibly generic keywords, not the vocabulary. The generic ones are left
+    out when the posting lists are built, and filter_keys then runs on the
+    remainder, so the result is identical to filter_keys on the full map.
+    "top_n" ranks every keyword of a chunk, so in that mode nothing can be
+    left out early.
+    """
+    if mode not in FILTER_MODES:
+        raise ValueError(f"Unknown KEYWORD_FILTER_MODE '{mode}', expected one of {sorted(FILTER_MODES)}")
+    threshold = FREQUENCY_THRESHOLD
+    keep_list = KEEP_LIST
+    total_chunks = postings.total_chunks
+
+    print(f"\n--- Starting Streaming Frequency Filtering ---")
+    print(f"Total chunks: {total_chunks}")
+    print(f"Sketch: {document_frequency.depth}x{document_frequency.width} "
+          f"(~{document_frequency.memory_bytes() / 1e6:.1f} MB)")
+
+    generic = {}
+    if mode in ("prevalence", "both"):
+        exact = {}
+        for _, keywords in postings.replay():
+            for kw in keywords:
+                if kw in exact:
+                    exact[kw] += 1
+                elif document_frequency.estimate(kw) / max(total_chunks, 1) > threshold:
+                    exact[kw] = 1
+        generic = {kw: df for kw, df in exact.items()
+                   if df / max(total_chunks, 1) > threshold and kw not in keep_list}
+        print(f"Counted {len(exact)} possibly generic keywords exactly, {len(generic)} are generic.")
+        top_removed = sorted(generic.items(), key=lambda item: -item[1])[:10]
+        print("Top 10 most frequent (and removed) keywords:")
+        for kw, df in top_removed:
+            print(f"- '{kw}' (found in {df / max(total_chunks, 1):.1%} of chunks)")
+    else:
+        print(f"Warning: KEYWORD_FILTER_MODE={mode} ranks every keyword of a chunk; "
+              f"no posting lists can be skipped while streaming")
+
+    key_chunk_map = postings.build(keep=lambda kw: kw not in generic)
+    return filter_keys(key_chunk_map, total_chunks, mode=mode, keywords_per_chunk=keywords_per_chunk)
+
 if __name__ == '__main__':
     # --- Example Usage ---
 
@@ -98,10 +249,8 @@ if __name__ == '__main__':
 
     # 2. Run the filtering function
     filtered_map = filter_keys(
-        key_chunk_map=key_chunk_map,
-        total_chunks=TOTAL_CHUNKS_IN_DATASET,
-        threshold=FREQUENCY_THRESHOLD,
-        keep_list=KEEP_LIST
+        key_chunk_map=KeywordPostings.from_map(key_chunk_map, TOTAL_CHUNKS_IN_DATASET),
+        total_chunks=TOTAL_CHUNKS_IN_DATASET
     )
 
     # 3. View the results
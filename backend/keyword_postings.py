@@ -0,0 +1,204 @@
+# keyword_postings.py
+
+import hashlib
+import pickle
+import tempfile
+from array import array
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+
+class KeywordPostings:
+    """
+    Keyword -> chunk posting lists in CSR layout.
+
+    Chunk texts live once in `chunks` (the chunk table); a chunk's id is its
+    index in that table. The chunk ids of keyword `keywords[k]` are
+    `indices[indptr[k]:indptr[k + 1]]`, in ascending order. `total_chunks`
+    is the number of chunks the map was built from, including chunks that
+    produced no keywords. `idf`, once set by keyword_filter.filter_keys,
+    holds one IDF weight per keyword.
+    """
+
+    def __init__(self, chunks: List[str], keywords: List[str], indptr: array, indices: array, total_chunks: int,
+                 idf: Optional[array] = None):
+        self.chunks = chunks
+        self.keywords = keywords
+        self.indptr = indptr
+        self.indices = indices
+        self.total_chunks = total_chunks
+        self.idf = idf
+
+    def __len__(self) -> int:
+        return len(self.keywords)
+
+    def keys(self) -> List[str]:
+        return self.keywords
+
+    def chunk_ids(self, k: int) -> array:
+        """Chunk ids of the k-th keyword."""
+        return self.indices[self.indptr[k]:self.indptr[k + 1]]
+
+    def document_frequency(self, k: int) -> int:
+        return self.indptr[k + 1] - self.indptr[k]
+
+    def items(self) -> Iterator[Tuple[str, List[str]]]:
+        """(keyword, chunk texts) pairs, shaped like the old keyword -> chunks dict."""
+        for k, keyword in enumerate(self.keywords):
+            yield keyword, [self.chunks[c] for c in self.chunk_ids(k)]
+
+    def chunk_key(self, c: int) -> str:
+        """Stable id of chunk c: the MD5 chunk_id chunker2 assigns to the same text."""
+        return hashlib.md5(self.chunks[c].encode()).hexdigest()
+
+    def used_chunk_ids(self) -> List[int]:
+        """Ids of the chunks referenced by at least one keyword, ascending."""
+        return sorted(set(self.indices))
+
+    def select(self, keyword_indexes: Iterable[int]) -> "KeywordPostings":
+        """A new postings object holding only the given keywords; the chunk table is shared."""
+        keywords = []
+        indptr = array("I", [0])
+        indices = array("I")
+        idf = None if self.idf is None else array("d")
+        for k in keyword_indexes:
+            keywords.append(self.keywords[k])
+            indices.extend(self.chunk_ids(k))
+            indptr.append(len(indices))
+            if idf is not None:
+                idf.append(self.idf[k])
+        return KeywordPostings(self.chunks, keywords, indptr, indices, self.total_chunks, idf)
+
+    def to_dict(self) -> Dict:
+        """JSON-serializable form (used by the ingestion cache)."""
+        return {
+            "chunks": self.chunks,
+            "keywords": self.keywords,
+            "indptr": self.indptr.tolist(),
+            "indices": self.indices.tolist(),
+            "total_chunks": self.total_chunks,
+            "idf": None if self.idf is None else self.idf.tolist(),
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "KeywordPostings":
+        return cls(
+            data["chunks"],
+            data["keywords"],
+            array("I", data["indptr"]),
+            array("I", data["indices"]),
+            data["total_chunks"],
+            None if data.get("idf") is None else array("d", data["idf"]),
+        )
+
+    @classmethod
+    def from_map(cls, key_chunk_map: Dict[str, List[str]], total_chunks: int) -> "KeywordPostings":
+        """Builds postings from a keyword -> chunk texts dict."""
+        builder = PostingsBuilder()
+        for keyword, chunks in key_chunk_map.items():
+            for chunk in chunks:
+                builder.add_keyword(keyword, builder.chunk_id(chunk))
+        builder.total_chunks = total_chunks
+        return builder.build()
+
+
+class PostingsBuilder:
+    """Accumulates keyword -> chunk id postings while chunks stream through NER."""
+
+    def __init__(self):
+        self.chunks: List[str] = []
+        self.total_chunks = 0
+        self._chunk_ids: Dict[str, int] = {}
+        self._postings: Dict[str, array] = {}
+
+    def chunk_id(self, chunk: str) -> int:
+        """Id of a chunk in the chunk table, adding it if it is new."""
+        chunk_id = self._chunk_ids.get(chunk)
+        if chunk_id is None:
+            chunk_id = self._chunk_ids[chunk] = len(self.chunks)
+            self.chunks.append(chunk)
+        return chunk_id
+
+    def add_keyword(self, keyword: str, chunk_id: int):
+        ids = self._postings.get(keyword)
+        if ids is None:
+            self._postings[keyword] = array("I", [chunk_id])
+        elif chunk_id not in ids[-1:]:
+            ids.append(chunk_id)
+
+    def add_chunk(self, chunk: str, keywords: Iterable[str]) -> bool:
+        """
+        Records one processed chunk and the keywords extracted from it.
+        Returns False if identical text was already recorded (and ignored).
+        """
+        self.total_chunks += 1
+        if chunk in self._chunk_ids:
+            # Identical text was already processed and yields the same keywords
+            return False
+        keywords = list(keywords)
+        if not keywords:
+            return True
+        chunk_id = self.chunk_id(chunk)
+        for keyword in keywords:
+            self.add_keyword(keyword, chunk_id)
+        return True
+
+    def build(self) -> KeywordPostings:
+        keywords = list(self._postings)
+        indptr = array("I", [0])
+        indices = array("I")
+        for keyword in keywords:
+            ids = self._postings[keyword]
+            if len(ids) > 1 and any(a >= b for a, b in zip(ids, ids[1:])):
+                ids = array("I", sorted(set(ids)))
+            indices.extend(ids)
+            indptr.append(len(indices))
+        self._postings = {}
+        self._chunk_ids = {}
+        return KeywordPostings(self.chunks, keywords, indptr, indices, self.total_chunks)
+
+
+class SpooledPostingsBuilder(PostingsBuilder):
+    """
+    PostingsBuilder that spools each new chunk's keywords to a temporary
+    file instead of growing posting lists, so memory during NER does not
+    depend on the vocabulary. `on_chunk`, if given, sees every new chunk's
+    distinct keywords as they are recorded (see
+    keyword_filter.StreamingDocumentFrequency). build(keep) replays the
+    spool and materializes only the keywords `keep` accepts; the result is
+    the same as PostingsBuilder.build() followed by select().
+    """
+
+    def __init__(self, on_chunk: Callable[[List[str]], None] = None):
+        super().__init__()
+        self.on_chunk = on_chunk
+        self._spool = tempfile.TemporaryFile()
+
+    def add_chunk(self, chunk: str, keywords: Iterable[str]) -> bool:
+        self.total_chunks += 1
+        if chunk in self._chunk_ids:
+            # Identical text was already processed and yields the same keywords
+            return False
+        keywords = list(dict.fromkeys(keywords))
+        if not keywords:
+            return True
+        pickle.dump((self.chunk_id(chunk), keywords), self._spool, pickle.HIGHEST_PROTOCOL)
+        if self.on_chunk is not None:
+            self.on_chunk(keywords)
+        return True
+
+    def replay(self) -> Iterator[Tuple[int, List[str]]]:
+        """(chunk id, distinct keywords) of every spooled chunk, in the order they were added."""
+        self._spool.seek(0)
+        while True:
+            try:
+                yield pickle.load(self._spool)
+            except EOFError:
+                return
+
+    def build(self, keep: Callable[[str], bool] = None) -> KeywordPostings:
+        for chunk_id, keywords in self.replay():
+            for keyword in keywords:
+                if keep is None or keep(keyword):
+                    self.add_keyword(keyword, chunk_id)
+        self._spool.close()
+        return super().build()
@@ -0,0 +1,145 @@
+# keyword_similarity.py
+
+import time
+import zlib
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from config import (
+    SIMILARITY_THRESHOLD,
+    SIMILARITY_TOP_K,
+    SIMILARITY_NUM_PERM,
+    SIMILARITY_BANDS,
+    SIMILARITY_MAX_BUCKET,
+)
+
+NGRAM_SIZE = 3
+SIGNATURE_BLOCK = 4096  # keywords hashed per vectorized block
+EMPTY_HASH = np.uint64(0xFFFFFFFF)
+ESTIMATE_MARGIN = 0.15  # ~2.4 standard deviations of a 64-permutation MinHash estimate
+
+
+def char_ngrams(keyword: str, n: int = NGRAM_SIZE) -> set:
+    """Character n-grams of a keyword, padded so short keywords still have some."""
+    padded = f" {keyword.lower()} "
+    return {padded[i:i + n] for i in range(max(1, len(padded) - n + 1))}
+
+
+def minhash_signatures(shingle_sets: List[set], num_perm: int = SIMILARITY_NUM_PERM, seed: int = 0) -> np.ndarray:
+    """
+    MinHash signatures, shape (num_perm, len(shingle_sets)).
+
+    Shingles are hashed once with CRC32; permutation i is the universal
+    hash ((a_i * x + b_i) mod 2**64) >> 32, evaluated for all shingles of a
+    block of keywords at once, and each keyword keeps the minimum per row.
+    """
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, 2 ** 63, size=num_perm, dtype=np.uint64) | np.uint64(1)
+    b = rng.integers(0, 2 ** 63, size=num_perm, dtype=np.uint64)
+    signatures = np.full((num_perm, len(shingle_sets)), EMPTY_HASH, dtype=np.uint64)
+
+    for start in range(0, len(shingle_sets), SIGNATURE_BLOCK):
+        block = shingle_sets[start:start + SIGNATURE_BLOCK]
+        sizes = np.fromiter((len(s) for s in block), dtype=np.int64, count=len(block))
+        hashes = np.fromiter(
+            (zlib.crc32(shingle.encode()) for shingles in block for shingle in shingles),
+            dtype=np.uint64, count=int(sizes.sum()),
+        )
+        if not len(hashes):
+            continue
+        permuted = (a[:, None] * hashes[None, :] + b[:, None]) >> np.uint64(32)
+        offsets = np.r_[0, np.cumsum(sizes)[:-1]]
+        non_empty = sizes > 0
+        signatures[:, start + np.flatnonzero(non_empty)] = np.minimum.reduceat(
+            permuted, offsets[non_empty], axis=1
+        )
+    return signatures
+
+
+def candidate_pairs(signatures: np.ndarray, bands: int = SIMILARITY_BANDS,
+                    max_bucket: int = SIMILARITY_MAX_BUCKET, min_estimate: float = 0.0) -> np.ndarray:
+    """
+    LSH banding: keywords whose signatures agree on every row of at least
+    one band become candidate pairs. Returns unique (i, j) pairs, i < j.
+    Buckets larger than max_bucket (very short, generic shingle sets) only
+    contribute pairs among their first max_bucket members. Pairs whose
+    MinHash similarity estimate is below min_estimate are dropped as they
+    are generated, which keeps memory proportional to the real matches.
+    """
+    num_perm, count = signatures.shape
+    rows = num_perm // bands
+    mixers = np.random.default_rng(1).integers(1, 2 ** 63, size=rows, dtype=np.uint64) | np.uint64(1)
+    codes = []
+    for band in range(bands):
+        keys = (signatures[band * rows:(band + 1) * rows] * mixers[:, None]).sum(axis=0, dtype=np.uint64)
+        order = np.argsort(keys, kind="stable")
+        sorted_keys = keys[order]
+        starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+        sizes = np.diff(np.r_[starts, count])
+        # Position of every keyword within its (sorted) bucket
+        rank = np.arange(count) - np.repeat(starts, sizes)
+        # Pair each member with the member `offset` places later in the same
+        # bucket, for all buckets at once
+        for offset in range(1, min(int(sizes.max()), max_bucket)):
+            same = (sorted_keys[:-offset] == sorted_keys[offset:]) & (rank[offset:] < max_bucket)
+            i = order[:-offset][same]
+            j = order[offset:][same]
+            if min_estimate > 0:
+                keep = (signatures[:, i] == signatures[:, j]).mean(axis=0) >= min_estimate
+                i, j = i[keep], j[keep]
+            codes.append(np.minimum(i, j).astype(np.int64) * count + np.maximum(i, j))
+    if not codes:
+        return np.empty((0, 2), dtype=np.int64)
+    unique = np.unique(np.concatenate(codes))
+    return np.stack([unique // count, unique % count], axis=1)
+
+
+def similar_keyword_pairs(
+    keywords: List[str],
+    threshold: float = SIMILARITY_THRESHOLD,
+    top_k: int = SIMILARITY_TOP_K,
+) -> List[Tuple[str, str, float]]:
+    """
+    Pairs of keywords whose character-trigram Jaccard similarity is at least
+    `threshold`, found through MinHash LSH instead of comparing all pairs.
+    Candidates are verified with the exact Jaccard; pairs are then taken
+    best-first while both keywords have fewer than `top_k` partners.
+    """
+    if len(keywords) < 2:
+        return []
+    shingle_sets = [char_ngrams(kw) for kw in keywords]
+    signatures = minhash_signatures(shingle_sets)
+    # Candidates whose MinHash estimate is far below the threshold are
+    # dropped before computing exact Jaccard similarities in Python
+    candidates = candidate_pairs(signatures, min_estimate=threshold - ESTIMATE_MARGIN)
+
+    scored = []
+    for i, j in candidates.tolist():
+        a, b = shingle_sets[i], shingle_sets[j]
+        score = len(a & b) / len(a | b)
+        if score >= threshold:
+            scored.append((score, i, j))
+    scored.sort(key=lambda item: (-item[0], item[1], item[2]))
+
+    degree = [0] * len(keywords)
+    pairs = []
+    for score, i, j in scored:
+        if degree[i] < top_k and degree[j] < top_k:
+            degree[i] += 1
+            degree[j] += 1
+            pairs.append((keywords[i], keywords[j], round(score, 4)))
+    return pairs
+
+
+def similarity_rows(keywords: List[str]) -> Tuple[List[Dict], float]:
+    """
+    SIMILAR_TO rows ({a, b, score}, with a < b) for graph_builder2, plus the
+    seconds the stage took.
+    """
+    start = time.perf_counter()
+    rows = [
+        {"a": min(a, b), "b": max(a, b), "score": score}
+        for a, b, score in similar_keyword_pairs(keywords)
+    ]
+    return rows, time.perf_counter() - start
@@ -0,0 +1,211 @@
+# lexical_index.py
+
+import os
+import re
+import threading
+import uuid
+import zipfile
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from config import (
+    LEXICAL_INDEX_DIR,
+    LEXICAL_INDEX_CACHE_SIZE,
+    LEXICAL_TOP_N,
+    LEXICAL_CONFIDENT_SCORE,
+    LEXICAL_LOCAL_MAX,
+)
+from keyword_similarity import char_ngrams
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def light_lemma(token: str) -> str:
+    """Cheap plural folding for query tokens; graph keywords are already spaCy lemmas."""
+    if len(token) > 4 and token.endswith("ies"):
+        return token[:-3] + "y"
+    if len(token) > 4 and token.endswith(("ses", "xes", "zes", "ches", "shes")):
+        return token[:-2]
+    if len(token) > 3 and token.endswith("s") and not token.endswith(("ss", "us", "is")):
+        return token[:-1]
+    return token
+
+
+def lemma_tokens(text: str) -> List[str]:
+    return [light_lemma(token) for token in TOKEN_RE.findall(text.lower())]
+
+
+def _postings(groups: List[List[str]]):
+    """Inverted index of term -> ids (CSR) for a list of term lists, plus the distinct term count per id."""
+    vocab: Dict[str, int] = {}
+    term_ids, owner_ids, counts = [], [], []
+    for owner, terms in enumerate(groups):
+        unique = set(terms)
+        counts.append(len(unique))
+        for term in unique:
+            term_ids.append(vocab.setdefault(term, len(vocab)))
+            owner_ids.append(owner)
+    term_ids = np.asarray(term_ids, dtype=np.int64)
+    owner_ids = np.asarray(owner_ids, dtype=np.int32)
+    order = np.argsort(term_ids, kind="stable")
+    indptr = np.r_[0, np.cumsum(np.bincount(term_ids, minlength=len(vocab)))].astype(np.int64)
+    return vocab, indptr, owner_ids[order], np.asarray(counts, dtype=np.int32)
+
+
+class LexicalIndex:
+    """
+    Local candidate retrieval over a thread's keyword vocabulary.
+
+    A character-trigram inverted index scores how much of each keyword's
+    spelling appears in the query (trigram containment), and a token index
+    over lightly lemmatized words scores how many of a keyword's words the
+    query uses (token coverage). The mean of the two ranks keywords, so
+    only the top candidates need to go to Gemini; keywords whose every
+    word and nearly every trigram occur in the query are "confident" and
+    can be used without the LLM at all.
+    """
+
+    def __init__(self, keywords: List[str], version: Optional[str], trigram_postings: tuple, token_postings: tuple):
+        self.keywords = list(keywords)
+        self.version = version
+        self.trigrams, self.trigram_indptr, self.trigram_indices, self.trigram_counts = trigram_postings
+        self.tokens, self.token_indptr, self.token_indices, self.token_counts = token_postings
+
+    @classmethod
+    def build(cls, keywords: List[str], version: Optional[str] = None) -> "LexicalIndex":
+        return cls(
+            keywords,
+            version,
+            _postings([char_ngrams(kw) for kw in keywords]),
+            _postings([lemma_tokens(kw) for kw in keywords]),
+        )
+
+    def __len__(self) -> int:
+        return len(self.keywords)
+
+    def _matches(self, terms, vocab, indptr, indices, counts) -> np.ndarray:
+        ids = [vocab[t] for t in set(terms) if t in vocab]
+        if not ids:
+            return np.zeros(len(self.keywords))
+        hits = np.concatenate([indices[indptr[i]:indptr[i + 1]] for i in ids])
+        shared = np.bincount(hits, minlength=len(self.keywords))
+        return shared / np.maximum(counts, 1)
+
+    def scores(self, query: str) -> np.ndarray:
+        containment = self._matches(char_ngrams(query), self.trigrams, self.trigram_indptr,
+                                    self.trigram_indices, self.trigram_counts)
+        coverage = self._matches(lemma_tokens(query), self.tokens, self.token_indptr,
+                                 self.token_indices, self.token_counts)
+        return (containment + coverage) / 2
+
+    def search(self, query: str, top_n: int = LEXICAL_TOP_N) -> Dict:
+        """
+        Returns {"candidates": top-N keywords with a non-zero score, best
+        first, "confident": keywords the query spells out (score >=
+        LEXICAL_CONFIDENT_SCORE), capped at LEXICAL_LOCAL_MAX}.
+        """
+        if not self.keywords:
+            return {"candidates": [], "confident": []}
+        scores = self.scores(query)
+        matched = np.flatnonzero(scores > 0)
+        if len(matched) > top_n:
+            matched = matched[np.argpartition(-scores[matched], top_n - 1)[:top_n]]
+        ranked = matched[np.lexsort((matched, -scores[matched]))]
+        confident = [self.keywords[k] for k in ranked if scores[k] >= LEXICAL_CONFIDENT_SCORE]
+        return {
+            "candidates": [self.keywords[k] for k in ranked],
+            "confident": confident[:LEXICAL_LOCAL_MAX],
+        }
+
+    # --- Persistence (one file per thread) ---
+    @staticmethod
+    def path(thread_id: str, index_dir: str = LEXICAL_INDEX_DIR) -> str:
+        safe = re.sub(r"[^A-Za-z0-9_.-]", "_", thread_id)
+        return os.path.join(index_dir, f"{safe}.npz")
+
+    def save(self, thread_id: str, index_dir: str = LEXICAL_INDEX_DIR):
+        os.makedirs(index_dir, exist_ok=True)
+        path = self.path(thread_id, index_dir)
+        # Unique per writer, so concurrent saves for one thread do not share a temp file
+        tmp_path = f"{path}.tmp-{uuid.uuid4().hex}.npz"
+        arrays = {"keywords": np.asarray(self.keywords, dtype=str), "version": np.asarray(self.version or "")}
+        for name in ("trigram", "token"):
+            vocab = getattr(self, f"{name}s")
+            arrays[f"{name}_vocab"] = np.asarray(sorted(vocab, key=vocab.get), dtype=str)
+            arrays[f"{name}_indptr"] = getattr(self, f"{name}_indptr")
+            arrays[f"{name}_indices"] = getattr(self, f"{name}_indices")
+            arrays[f"{name}_counts"] = getattr(self, f"{name}_counts")
+        try:
+            np.savez(tmp_path, **arrays)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    @classmethod
+    def load(cls, thread_id: str, index_dir: str = LEXICAL_INDEX_DIR) -> Optional["LexicalIndex"]:
+        try:
+            with np.load(cls.path(thread_id, index_dir)) as data:
+                parts = {}
+                for name in ("trigram", "token"):
+                    vocab = data[f"{name}_vocab"].tolist()
+                    parts[name] = (
+                        dict(zip(vocab, range(len(vocab)))),
+                        data[f"{name}_indptr"],
+                        data[f"{name}_indices"],
+                        data[f"{name}_counts"],
+                    )
+                return cls(data["keywords"].tolist(), str(data["version"]) or None, parts["trigram"], parts["token"])
+        except (OSError, KeyError, ValueError, EOFError, zipfile.BadZipFile):
+            # Missing, truncated or corrupt: the caller rebuilds it
+            return None
+
+    @classmethod
+    def remove(cls, thread_id: str, index_dir: str = LEXICAL_INDEX_DIR):
+        try:
+            os.remove(cls.path(thread_id, index_dir))
+        except OSError:
+            pass
+
+
+class LexicalIndexCache:
+    """Loaded indexes of recently queried threads (LRU, LEXICAL_INDEX_CACHE_SIZE threads)."""
+
+    def __init__(self, size: int = LEXICAL_INDEX_CACHE_SIZE):
+        self.size = size
+        self._entries: "OrderedDict[str, LexicalIndex]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, thread_id: str, version: Optional[str], keywords: List[str]) -> LexicalIndex:
+        """
+        The thread's index at `version`: from memory, else from the file
+        written at ingest, else rebuilt from `keywords` (and saved).
+        """
+        with self._lock:
+            index = self._entries.get(thread_id)
+            if index is not None and version is not None and index.version == version:
+                self._entries.move_to_end(thread_id)
+                return index
+
+        index = LexicalIndex.load(thread_id)
+        if index is None or version is None or index.version != version:
+            index = LexicalIndex.build(keywords, version)
+            if version is not None:
+                try:
+                    index.save(thread_id)
+                except Exception as e:
+                    # The index is already built; a failed save only costs a rebuild next time
+                    print(f"Warning: Failed to save lexical index for thread_id={thread_id}: {e}")
+
+        with self._lock:
+            self._entries[thread_id] = index
+            self._entries.move_to_end(thread_id)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+        return index
+
+
+lexical_indexes = LexicalIndexCache()
@@ -0,0 +1,545 @@
+# memory_graph.py
+
+import json
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from scipy import sparse
+
+from config import (
+    MAX_DEPTH,
+    PRIMARY_TOP_K,
+    PRIMARY_WEIGHTING,
+    EXPANSION_PER_KEYWORD,
+    EXPANSION_MAX_CHUNKS,
+    SIMILARITY_EDGES_ENABLED,
+    MEMORY_GRAPH_DIR,
+    MEMORY_GRAPH_CACHE_SIZE,
+)
+from graph_builder2 import KnowledgeGraphBuilder
+from graph_retriever2 import GraphRetriever
+from keyword_filter import idf_weights
+from keyword_postings import KeywordPostings
+from keyword_similarity import similarity_rows
+from lexical_index import LexicalIndex
+
+# Sparse matrices persisted per thread, as .npy triples (data/indices/indptr)
+# so they can be memory-mapped on load
+MATRICES = ("appears_in", "contains", "similar_to")
+
+# Each version of a thread's graph lives in its own subdirectory; this file
+# names the current one and is only ever replaced atomically
+CURRENT = "CURRENT"
+LOAD_ATTEMPTS = 3
+
+
+def _thread_dir(thread_id: str, graph_dir: str = MEMORY_GRAPH_DIR) -> str:
+    return os.path.join(graph_dir, re.sub(r"[^A-Za-z0-9_.-]", "_", thread_id))
+
+
+def _csr(rows: np.ndarray, cols: np.ndarray, values: np.ndarray, shape: Tuple[int, int]) -> sparse.csr_matrix:
+    matrix = sparse.csr_matrix((values, (rows, cols)), shape=shape, dtype=np.float32)
+    matrix.sum_duplicates()
+    return matrix
+
+
+class MemoryGraph:
+    """
+    One thread's keyword/chunk graph as sparse matrices.
+
+    `appears_in` is keywords x chunks (1.0 per APPEARS_IN edge), `contains`
+    its transpose (chunks x keywords), `similar_to` the symmetric keywords x
+    keywords SIMILAR_TO scores. Row/column k is `keywords[k]`, column/row c
+    is the chunk with id `chunk_ids[c]`. `df` holds each keyword's document
+    frequency out of `total_chunks` (Keyword.df and ThreadMeta.total_chunks
+    in Neo4j); IDF is derived from them when scoring. Chunk texts are one
+    UTF-8 blob sliced by `content_offsets`.
+    """
+
+    def __init__(self, version: str, keywords: List[str], df: np.ndarray, total_chunks: int,
+                 chunk_ids: List[str], content: np.ndarray, content_offsets: np.ndarray,
+                 appears_in: sparse.csr_matrix, contains: sparse.csr_matrix, similar_to: sparse.csr_matrix):
+        self.version = version
+        self.keywords = keywords
+        self.df = df
+        self.total_chunks = total_chunks
+        self.chunk_ids = chunk_ids
+        self.content = content
+        self.content_offsets = content_offsets
+        self.appears_in = appears_in
+        self.contains = contains
+        self.similar_to = similar_to
+        self._keyword_index = None
+        self._chunk_id_array = None
+        self._idf = None
+
+    @property
+    def idf(self) -> np.ndarray:
+        """One IDF weight per keyword, with the formula PRIMARY_CHUNKS uses."""
+        if self._idf is None:
+            self._idf = idf_weights(np.asarray(self.df), self.total_chunks).astype(np.float32)
+        return self._idf
+
+    @property
+    def keyword_index(self) -> Dict[str, int]:
+        if self._keyword_index is None:
+            self._keyword_index = {kw: k for k, kw in enumerate(self.keywords)}
+        return self._keyword_index
+
+    @property
+    def chunk_id_array(self) -> np.ndarray:
+        """`chunk_ids` as an array, for vectorized tie-breaking by chunk id."""
+        if self._chunk_id_array is None:
+            self._chunk_id_array = np.asarray(self.chunk_ids, dtype=str)
+        return self._chunk_id_array
+
+    def chunk_content(self, c: int) -> str:
+        return bytes(self.content[self.content_offsets[c]:self.content_offsets[c + 1]]).decode()
+
+    def capped_links(self, keyword_rows: np.ndarray, visited: np.ndarray, per_keyword: int) -> np.ndarray:
+        """
+        Per chunk, how many of `keyword_rows` link to it when every keyword
+        contributes only its first `per_keyword` chunks not yet `visited`
+        (fan-out cap). Columns are in chunk id order, so these are the
+        lowest ids, as in graph_retriever2.EXPANSION_HOP.
+        """
+        rows = self.appears_in[keyword_rows]
+        rows.sort_indices()
+        keep = ~visited[rows.indices]
+        row_of = np.repeat(np.arange(rows.shape[0]), np.diff(rows.indptr))[keep]
+        kept = rows.indices[keep]
+        rank = np.arange(len(kept)) - np.searchsorted(row_of, np.arange(rows.shape[0]))[row_of]
+        return np.bincount(kept[rank < per_keyword], minlength=self.appears_in.shape[1])
+
+    @classmethod
+    def from_postings(cls, keyword_to_chunks_map: KeywordPostings, similar_rows: List[Dict],
+                      version: str) -> "MemoryGraph":
+        keywords = list(keyword_to_chunks_map.keys())
+        # Chunk ids are content hashes, so identical texts share one column;
+        # columns are in chunk id order (the tie-break order of the queries)
+        chunk_keys = {c: keyword_to_chunks_map.chunk_key(c) for c in keyword_to_chunks_map.used_chunk_ids()}
+        texts_by_key = {key: keyword_to_chunks_map.chunks[c].encode() for c, key in chunk_keys.items()}
+        chunk_ids = sorted(texts_by_key)
+        key_column = {key: i for i, key in enumerate(chunk_ids)}
+        column = {c: key_column[key] for c, key in chunk_keys.items()}
+        texts = [texts_by_key[key] for key in chunk_ids]
+
+        indptr = np.asarray(keyword_to_chunks_map.indptr, dtype=np.int64)
+        rows = np.repeat(np.arange(len(keywords)), np.diff(indptr))
+        cols = np.fromiter((column[c] for c in keyword_to_chunks_map.indices), dtype=np.int64,
+                           count=len(keyword_to_chunks_map.indices))
+        shape = (len(keywords), len(chunk_ids))
+        appears_in = _csr(rows, cols, np.ones(len(cols)), shape)
+        contains = _csr(cols, rows, np.ones(len(cols)), (shape[1], shape[0]))
+        # Edges are unweighted even if two posted chunks had the same text
+        appears_in.data[:] = contains.data[:] = 1.0
+
+        index = {kw: k for k, kw in enumerate(keywords)}
+        a = np.asarray([index[row["a"]] for row in similar_rows], dtype=np.int64)
+        b = np.asarray([index[row["b"]] for row in similar_rows], dtype=np.int64)
+        scores = np.asarray([row["score"] for row in similar_rows], dtype=np.float32)
+        similar_to = _csr(np.r_[a, b], np.r_[b, a], np.r_[scores, scores], (shape[0], shape[0]))
+
+        df = np.diff(indptr)
+        offsets = np.r_[0, np.cumsum([len(t) for t in texts], dtype=np.int64)].astype(np.int64)
+        content = np.frombuffer(b"".join(texts), dtype=np.uint8)
+        graph = cls(version, keywords, df, keyword_to_chunks_map.total_chunks, chunk_ids, content, offsets, appears_in, contains, similar_to)
+        graph._keyword_index = index
+        return graph
+
+    # --- Persistence (one subdirectory of .npy files per version, named by CURRENT) ---
+    def save(self, thread_id: str, graph_dir: str = MEMORY_GRAPH_DIR):
+        """
+        Writes the graph into its own version directory, then points CURRENT
+        at it with an atomic replace: readers see the old or the new version,
+        never a missing or half-written one.
+        """
+        path = _thread_dir(thread_id, graph_dir)
+        os.makedirs(path, exist_ok=True)
+        tmp_path = os.path.join(path, f"{self.version}.tmp-{uuid.uuid4().hex}")
+        os.makedirs(tmp_path)
+        arrays = {
+            "keywords": np.asarray(self.keywords, dtype=str),
+            "df": self.df,
+            "chunk_ids": np.asarray(self.chunk_ids, dtype=str),
+            "content": self.content,
+            "content_offsets": self.content_offsets,
+        }
+        for name in MATRICES:
+            matrix = getattr(self, name)
+            arrays[f"{name}.data"] = matrix.data
+            arrays[f"{name}.indices"] = matrix.indices
+            arrays[f"{name}.indptr"] = matrix.indptr
+        for name, values in arrays.items():
+            np.save(os.path.join(tmp_path, f"{name}.npy"), values)
+        with open(os.path.join(tmp_path, "meta.json"), "w") as f:
+            json.dump({"version": self.version, "keywords": len(self.keywords), "chunks": len(self.chunk_ids),
+                       "total_chunks": self.total_chunks}, f)
+        os.replace(tmp_path, os.path.join(path, self.version))
+
+        pointer = os.path.join(path, f"{CURRENT}.tmp-{uuid.uuid4().hex}")
+        with open(pointer, "w") as f:
+            f.write(self.version)
+        os.replace(pointer, os.path.join(path, CURRENT))
+
+        # Mappings already open on older versions stay valid after the
+        # delete; keep whatever CURRENT names now in case another writer swapped
+        keep = {self.version, MemoryGraph.read_version(thread_id, graph_dir)}
+        for entry in os.listdir(path):
+            if entry not in keep and ".tmp-" not in entry and os.path.isdir(os.path.join(path, entry)):
+                shutil.rmtree(os.path.join(path, entry), ignore_errors=True)
+
+    @classmethod
+    def _load_version(cls, path: str, version: str) -> "MemoryGraph":
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        if meta["version"] != version:
+            raise ValueError(f"{path} holds version {meta['version']}, not {version}")
+
+        def array(name):
+            return np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+
+        shapes = {
+            "appears_in": (meta["keywords"], meta["chunks"]),
+            "contains": (meta["chunks"], meta["keywords"]),
+            "similar_to": (meta["keywords"], meta["keywords"]),
+        }
+        matrices = {
+            name: sparse.csr_matrix(
+                (array(f"{name}.data"), array(f"{name}.indices"), array(f"{name}.indptr")),
+                shape=shapes[name], copy=False,
+            )
+            for name in MATRICES
+        }
+        return cls(
+            version,
+            np.load(os.path.join(path, "keywords.npy")).tolist(),
+            array("df"),
+            meta["total_chunks"],
+            np.load(os.path.join(path, "chunk_ids.npy")).tolist(),
+            array("content"),
+            array("content_offsets"),
+            **matrices,
+        )
+
+    @classmethod
+    def load(cls, thread_id: str, graph_dir: str = MEMORY_GRAPH_DIR) -> Optional["MemoryGraph"]:
+        """
+        The thread's current graph, memory-mapped (None if it has none). All
+        files come from the version directory CURRENT named; if CURRENT moved
+        on while they were being opened, the load is retried.
+        """
+        path = _thread_dir(thread_id, graph_dir)
+        for _ in range(LOAD_ATTEMPTS):
+            version = cls.read_version(thread_id, graph_dir)
+            if version is None:
+                return None
+            try:
+                graph = cls._load_version(os.path.join(path, version), version)
+            except (OSError, KeyError, ValueError):
+                graph = None
+            if cls.read_version(thread_id, graph_dir) == version:
+                return graph
+        return None
+
+    @staticmethod
+    def read_version(thread_id: str, graph_dir: str = MEMORY_GRAPH_DIR) -> Optional[str]:
+        try:
+            with open(os.path.join(_thread_dir(thread_id, graph_dir), CURRENT)) as f:
+                return f.read().strip() or None
+        except OSError:
+            return None
+
+    @staticmethod
+    def remove(thread_id: str, graph_dir: str = MEMORY_GRAPH_DIR):
+        path = _thread_dir(thread_id, graph_dir)
+        old_path = f"{path}.old-{uuid.uuid4().hex}"
+        try:
+            os.replace(path, old_path)
+        except OSError:
+            return
+        shutil.rmtree(old_path, ignore_errors=True)
+
+
+class MemoryGraphCache:
+    """Loaded (memory-mapped) graphs of recently used threads (LRU, MEMORY_GRAPH_CACHE_SIZE threads)."""
+
+    def __init__(self, size: int = MEMORY_GRAPH_CACHE_SIZE, graph_dir: str = MEMORY_GRAPH_DIR):
+        self.size = size
+        self.graph_dir = graph_dir
+        self._entries: "OrderedDict[str, MemoryGraph]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, thread_id: str) -> Optional[MemoryGraph]:
+        """The thread's current graph (None if it has none), reloaded when another writer replaced it."""
+        version = MemoryGraph.read_version(thread_id, self.graph_dir)
+        with self._lock:
+            graph = self._entries.get(thread_id)
+            if graph is not None and graph.version == version:
+                self._entries.move_to_end(thread_id)
+                return graph
+        graph = MemoryGraph.load(thread_id, self.graph_dir) if version is not None else None
+        self.put(thread_id, graph)
+        return graph
+
+    def put(self, thread_id: str, graph: Optional[MemoryGraph]):
+        with self._lock:
+            if graph is None:
+                self._entries.pop(thread_id, None)
+                return
+            self._entries[thread_id] = graph
+            self._entries.move_to_end(thread_id)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+
+memory_graphs = MemoryGraphCache()
+
+
+class MemoryGraphBuilder(KnowledgeGraphBuilder):
+    """
+    KnowledgeGraphBuilder writing each thread's graph to local sparse-matrix
+    files (GRAPH_BACKEND=memory) instead of Neo4j. Needs no database server.
+    """
+
+    def __init__(self, graph_dir: str = MEMORY_GRAPH_DIR, similarity_edges: bool = SIMILARITY_EDGES_ENABLED,
+                 graphs: MemoryGraphCache = memory_graphs):
+        self.driver = None
+        self.database = None
+        self.graph_dir = graph_dir
+        self.similarity_edges = similarity_edges
+        self.graphs = graphs
+
+    def close(self):
+        pass
+
+    def schema_status(self):
+        return []
+
+    def clear_graph(self, thread_id: str, batch_size: int = None, drop_version: bool = False) -> Dict[str, int]:
+        """Deletes the thread's graph files; returns what was deleted, as the Neo4j builder does."""
+        graph = MemoryGraph.load(thread_id, self.graph_dir)
+        deleted = {"APPEARS_IN": 0, "SIMILAR_TO": 0, "Chunk": 0, "Keyword": 0}
+        if graph is not None:
+            deleted = {
+                "APPEARS_IN": int(graph.appears_in.nnz),
+                "SIMILAR_TO": int(graph.similar_to.nnz) // 2,
+                "Chunk": len(graph.chunk_ids),
+                "Keyword": len(graph.keywords),
+            }
+        MemoryGraph.remove(thread_id, self.graph_dir)
+        self.graphs.put(thread_id, None)
+        LexicalIndex.remove(thread_id)
+        print(f"🧹 Cleared in-memory graph for thread_id={thread_id} "
+              f"({', '.join(f'{n} {step}' for step, n in deleted.items())})")
+        return deleted
+
+    def _write_graph(self, keyword_to_chunks_map: KeywordPostings, thread_id: str, timings: Dict) -> MemoryGraph:
+        similar = []
+        if self.similarity_edges:
+            similar, timings["similarity"] = similarity_rows(keyword_to_chunks_map.keys())
+        phase_start = time.perf_counter()
+        graph = MemoryGraph.from_postings(keyword_to_chunks_map, similar, uuid.uuid4().hex)
+        timings["matrices"] = time.perf_counter() - phase_start
+        phase_start = time.perf_counter()
+        graph.save(thread_id, self.graph_dir)
+        self.graphs.put(thread_id, graph)
+        timings["write"] = time.perf_counter() - phase_start
+        timings["lexical_index"] = self._save_lexical_index(thread_id, graph.keywords, graph.version)
+        return graph
+
+    def build_graph_from_map(self, keyword_to_chunks_map: KeywordPostings, thread_id: str) -> Dict[str, float]:
+        """Builds the thread's matrices from the postings and persists them. Returns per-phase timings."""
+        print(f"Building in-memory graph for thread_id={thread_id} with {len(keyword_to_chunks_map)} keywords...")
+        timings = {}
+        build_start = time.perf_counter()
+        graph = self._write_graph(keyword_to_chunks_map, thread_id, timings)
+        timings["total"] = time.perf_counter() - build_start
+        print(f"✅ In-memory graph built for thread_id={thread_id} with {len(graph.chunk_ids)} chunks, "
+              f"{len(graph.keywords)} keywords and {graph.appears_in.nnz} APPEARS_IN edges "
+              f"in {timings['total']:.2f} seconds.")
+        return timings
+
+    def sync_graph_from_map(self, keyword_to_chunks_map: KeywordPostings, thread_id: str) -> Dict:
+        """
+        Rewrites the thread's matrices (there is nothing to gain from partial
+        writes here) and returns the same diff summary as the Neo4j builder.
+        """
+        print(f"Syncing in-memory graph for thread_id={thread_id} with {len(keyword_to_chunks_map)} keywords...")
+        timings = {}
+        sync_start = time.perf_counter()
+        old = MemoryGraph.load(thread_id, self.graph_dir)
+        timings["read"] = time.perf_counter() - sync_start
+        graph = self._write_graph(keyword_to_chunks_map, thread_id, timings)
+
+        def edges(g: Optional[MemoryGraph]) -> set:
+            if g is None:
+                return set()
+            rows, cols = g.appears_in.nonzero()
+            return {(g.keywords[k], g.chunk_ids[c]) for k, c in zip(rows.tolist(), cols.tolist())}
+
+        def similar(g: Optional[MemoryGraph]) -> set:
+            if g is None:
+                return set()
+            rows, cols = sparse.triu(g.similar_to, k=1).nonzero()
+            return {(g.keywords[a], g.keywords[b]) for a, b in zip(rows.tolist(), cols.tolist())}
+
+        old_chunks = set(old.chunk_ids) if old else set()
+        old_keywords = dict(zip(old.keywords, old.df.tolist())) if old else {}
+        new_keywords = dict(zip(graph.keywords, graph.df.tolist()))
+        old_edges, new_edges = edges(old), edges(graph)
+        old_similar, new_similar = similar(old), similar(graph)
+        timings["total"] = time.perf_counter() - sync_start
+        summary = {
+            "chunks_added": len(set(graph.chunk_ids) - old_chunks),
+            "chunks_removed": len(old_chunks - set(graph.chunk_ids)),
+            "chunks_unchanged": len(old_chunks & set(graph.chunk_ids)),
+            "keywords_added": len(new_keywords.keys() - old_keywords.keys()),
+            "keywords_removed": len(old_keywords.keys() - new_keywords.keys()),
+            "keywords_updated": sum(
+                1 for name in new_keywords.keys() & old_keywords.keys() if old_keywords[name] != new_keywords[name]
+            ),
+            "edges_added": len(new_edges - old_edges),
+            "edges_removed": len(old_edges - new_edges),
+            "similar_added": len(new_similar - old_similar),
+            "similar_removed": len(old_similar - new_similar),
+            "timings": timings,
+        }
+        print(f"✅ In-memory graph synced for thread_id={thread_id} in {timings['total']:.2f} seconds: "
+              f"chunks +{summary['chunks_added']}/-{summary['chunks_removed']}, "
+              f"keywords +{summary['keywords_added']}/-{summary['keywords_removed']}, "
+              f"APPEARS_IN +{summary['edges_added']}/-{summary['edges_removed']}")
+        return summary
+
+
+class MemoryGraphRetriever(GraphRetriever):
+    """
+    GraphRetriever over a thread's MemoryGraph: primary scoring and
+    neighborhood expansion are sparse matrix-vector products, with the same
+    semantics as the Neo4j queries.
+    """
+
+    def __init__(self, neo4j_uri=None, neo4j_user=None, neo4j_pass=None, neo4j_db=None, thread_id: str = None,
+                 graphs: MemoryGraphCache = memory_graphs):
+        self.driver = None
+        self.database = None
+        self.thread_id = thread_id
+        self.graphs = graphs
+        self._graph = None
+
+    def close(self):
+        self._graph = None
+
+    def schema_status(self):
+        return []
+
+    @property
+    def graph(self) -> Optional[MemoryGraph]:
+        # Loaded once per retriever (one chat turn), so a turn sees one version
+        if self._graph is None:
+            self._graph = self.graphs.get(self.thread_id)
+        return self._graph
+
+    def get_graph_version(self, thread_id: str) -> Optional[str]:
+        if thread_id == self.thread_id:
+            return self.graph.version if self.graph else None
+        return MemoryGraph.read_version(thread_id)
+
+    def get_vocabulary(self, thread_id: str) -> Tuple[Optional[str], List[str]]:
+        graph = self.graph if thread_id == self.thread_id else self.graphs.get(thread_id)
+        if graph is None:
+            return None, []
+        return graph.version, graph.keywords
+
+    def _chunks(self, columns, **fields) -> List[Dict]:
+        graph = self.graph
+        return [
+            {"id": graph.chunk_ids[c], "content": graph.chunk_content(c),
+             **{name: values[i] for name, values in fields.items()}}
+            for i, c in enumerate(columns)
+        ]
+
+    def primary_chunks(self, keywords: List[str], top_k: int = PRIMARY_TOP_K) -> List[Dict]:
+        graph = self.graph
+        if graph is None:
+            return []
+        rows = [graph.keyword_index[kw] for kw in dict.fromkeys(keywords) if kw in graph.keyword_index]
+        if not rows:
+            return []
+        query = np.zeros(len(graph.keywords), dtype=np.float32)
+        query[rows] = 1.0
+        matched = graph.contains @ query
+        if PRIMARY_WEIGHTING == "idf":
+            query[rows] = graph.idf[rows]
+            scores = graph.contains @ query
+        else:
+            scores = matched
+        hit = np.flatnonzero(matched)
+        # Same order as PRIMARY_CHUNKS: score, matched keywords, chunk id
+        ids = graph.chunk_id_array[hit]
+        order = np.lexsort((ids, -matched[hit], -scores[hit]))[:top_k]
+        columns = hit[order]
+        return self._chunks(columns, score=scores[columns].tolist(), matched=matched[columns].astype(int).tolist())
+
+    def _reached_keywords(self, frontier: np.ndarray) -> np.ndarray:
+        """Keywords of the frontier chunks plus their SIMILAR_TO neighbors (0/1 vector)."""
+        graph = self.graph
+        keywords = (graph.appears_in @ frontier) > 0
+        if graph.similar_to.nnz:
+            keywords |= (graph.similar_to @ keywords.astype(np.float32)) > 0
+        return keywords.astype(np.float32)
+
+    def _frontier(self, columns) -> np.ndarray:
+        frontier = np.zeros(len(self.graph.chunk_ids), dtype=np.float32)
+        frontier[list(columns)] = 1.0
+        return frontier
+
+    def _columns(self, chunks: List[Dict]) -> List[int]:
+        index = {chunk_id: c for c, chunk_id in enumerate(self.graph.chunk_ids)}
+        return [index[c["id"]] for c in chunks if c["id"] in index]
+
+    def expand_iterative(self, primary_chunks: List[Dict], max_depth: int = MAX_DEPTH) -> List[Dict]:
+        if self.graph is None:
+            return []
+        visited = np.zeros(len(self.graph.chunk_ids), dtype=bool)
+        frontier = self._columns(primary_chunks)
+        visited[frontier] = True
+        found = []
+        for depth in range(max_depth):
+            if not frontier:
+                break
+            reached = (self.graph.contains @ self._reached_keywords(self._frontier(frontier))) > 0
+            frontier = np.flatnonzero(reached & ~visited).tolist()
+            visited[frontier] = True
+            found.extend(frontier)
+        return self._chunks(found)
+
+    def expand_bounded(self, primary_chunks: List[Dict], max_depth: int = MAX_DEPTH,
+                       per_keyword: int = EXPANSION_PER_KEYWORD,
+                       max_chunks: int = EXPANSION_MAX_CHUNKS) -> List[Dict]:
+        if self.graph is None or max_depth < 1:
+            return []
+        chunk_ids = self.graph.chunk_id_array
+        visited = np.zeros(len(chunk_ids), dtype=bool)
+        frontier = self._columns(primary_chunks)
+        visited[frontier] = True
+        hits = []
+        for depth in range(1, max_depth + 1):
+            if not frontier:
+                break
+            reached = np.flatnonzero(self._reached_keywords(self._frontier(frontier)))
+            links = self.graph.capped_links(reached, visited, per_keyword)
+            candidates = np.flatnonzero((links > 0) & ~visited)
+            order = np.lexsort((chunk_ids[candidates], -links[candidates]))[:max_chunks]
+            frontier = candidates[order].tolist()
+            visited[frontier] = True
+            hits.extend((depth, -links[c], chunk_ids[c], c) for c in frontier)
+        hits.sort()
+        return self._chunks([c for _, _, _, c in hits[:max_chunks]])
@@ -0,0 +1,119 @@
+# neo4j_driver.py
+
+import atexit
+import hashlib
+import threading
+import time
+from typing import Dict, List
+
+import neo4j
+from neo4j import Driver, GraphDatabase
+from config import (
+    NEO4J_URI,
+    NEO4J_USER,
+    NEO4J_PASSWORD,
+    NEO4J_DATABASE,
+    NEO4J_MAX_POOL_SIZE,
+    NEO4J_ACQUISITION_TIMEOUT,
+)
+
+# One driver (and so one connection pool) per (uri, user, database) for the
+# whole process. Drivers are thread-safe; sessions are not and stay per call.
+# The key also holds a hash of the password, so rotated credentials get a
+# fresh driver (and the old one is closed) instead of silently reusing it.
+_drivers: Dict[tuple, Driver] = {}
+_created_at: Dict[tuple, float] = {}
+_lock = threading.Lock()
+
+# pool_stats reads per-address connection counts from driver internals,
+# only on driver major versions where their layout has been checked
+POOL_INTERNALS_VERSIONS = ("5.",)
+
+
+def _password_hash(password: str) -> str:
+    return hashlib.sha256((password or "").encode()).hexdigest()[:16]
+
+
+def get_driver(uri: str = NEO4J_URI, user: str = NEO4J_USER, password: str = NEO4J_PASSWORD,
+               database: str = NEO4J_DATABASE) -> Driver:
+    """
+    Returns the shared driver for (uri, user, database), creating it on
+    first use. A different password for the same key replaces (and closes)
+    the previous driver.
+    """
+    key = (uri, user, database, _password_hash(password))
+    driver = _drivers.get(key)
+    if driver is None:
+        stale = []
+        with _lock:
+            driver = _drivers.get(key)
+            if driver is None:
+                for old_key in [k for k in _drivers if k[:3] == key[:3]]:
+                    stale.append(_drivers.pop(old_key))
+                    _created_at.pop(old_key, None)
+                driver = GraphDatabase.driver(
+                    uri,
+                    auth=(user, password),
+                    max_connection_pool_size=NEO4J_MAX_POOL_SIZE,
+                    connection_acquisition_timeout=NEO4J_ACQUISITION_TIMEOUT,
+                )
+                _drivers[key] = driver
+                _created_at[key] = time.time()
+        for old_driver in stale:
+            try:
+                old_driver.close()
+            except Exception as e:
+                print(f"Warning: Failed to close Neo4j driver: {e}")
+    return driver
+
+
+def close_all():
+    """Closes every shared driver (app shutdown / interpreter exit)."""
+    with _lock:
+        drivers = list(_drivers.values())
+        _drivers.clear()
+        _created_at.clear()
+    for driver in drivers:
+        try:
+            driver.close()
+        except Exception as e:
+            print(f"Warning: Failed to close Neo4j driver: {e}")
+
+
+def pool_stats() -> List[Dict]:
+    """
+    Connection-pool utilization of every shared driver: configured limits
+    plus open/in-use connections per server address. The per-address
+    numbers come from the driver's private pool internals, so they are
+    reported only on driver versions listed in POOL_INTERNALS_VERSIONS.
+    """
+    with _lock:
+        items = list(_drivers.items())
+    internals = neo4j.__version__.startswith(POOL_INTERNALS_VERSIONS)
+    stats = []
+    for (uri, user, database, auth), driver in items:
+        entry = {
+            "uri": uri,
+            "user": user,
+            "database": database,
+            "max_pool_size": NEO4J_MAX_POOL_SIZE,
+            "acquisition_timeout": NEO4J_ACQUISITION_TIMEOUT,
+            "age_seconds": round(time.time() - _created_at.get((uri, user, database, auth), time.time()), 1),
+            "driver_version": neo4j.__version__,
+        }
+        connections = getattr(getattr(driver, "_pool", None), "connections", None) if internals else None
+        if connections is not None:
+            addresses = {}
+            for address, pool in list(connections.items()):
+                pooled = list(pool)
+                in_use = sum(1 for connection in pooled if getattr(connection, "in_use", False))
+                addresses[str(address)] = {"open": len(pooled), "in_use": in_use, "idle": len(pooled) - in_use}
+            entry["addresses"] = addresses
+            entry["open"] = sum(a["open"] for a in addresses.values())
+            entry["in_use"] = sum(a["in_use"] for a in addresses.values())
+            entry["utilization"] = entry["in_use"] / NEO4J_MAX_POOL_SIZE if NEO4J_MAX_POOL_SIZE else 0.0
+        stats.append(entry)
+    return stats
+
+
+atexit.register(close_all)
@@ -0,0 +1,95 @@
+# ner_cache.py
+
+import json
+import os
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, Tuple
+
+from config import NER_CACHE_ENABLED, NER_CACHE_PATH
+
+
+class NERCache:
+    """
+    SQLite cache of extracted keywords per chunk.
+
+    Rows are keyed by the chunk's MD5 chunk_id (as computed by
+    chunker2.split_into_chunks) plus an extractor-version hash, so changing
+    the model or extraction rules never serves stale keywords. Each row also
+    keeps the NER time the chunk originally took, which is what a hit saves.
+    """
+
+    def __init__(self, path: str = NER_CACHE_PATH, enabled: bool = NER_CACHE_ENABLED):
+        self.path = path
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self.seconds_saved = 0.0
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS ner_cache (
+                chunk_id TEXT NOT NULL,
+                extractor_version TEXT NOT NULL,
+                keywords TEXT NOT NULL,
+                elapsed REAL NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (chunk_id, extractor_version)
+            )
+            ''')
+            self._conn.commit()
+        return self._conn
+
+    def get_many(self, chunk_ids: List[str], extractor_version: str) -> Dict[str, Tuple[List[str], float]]:
+        """Returns chunk_id -> (keywords, original NER seconds) for the cached chunk_ids."""
+        if not self.enabled or not chunk_ids:
+            return {}
+        unique_ids = list(set(chunk_ids))
+        found = {}
+        with self._lock:
+            conn = self._connect()
+            # Stay well below SQLite's bound-parameter limit
+            for start in range(0, len(unique_ids), 500):
+                batch = unique_ids[start:start + 500]
+                rows = conn.execute(
+                    f"SELECT chunk_id, keywords, elapsed FROM ner_cache "
+                    f"WHERE extractor_version = ? AND chunk_id IN ({','.join('?' * len(batch))})",
+                    [extractor_version, *batch],
+                ).fetchall()
+                for chunk_id, keywords, elapsed in rows:
+                    found[chunk_id] = (json.loads(keywords), elapsed)
+            hits = sum(1 for chunk_id in chunk_ids if chunk_id in found)
+            self.hits += hits
+            self.misses += len(chunk_ids) - hits
+            self.seconds_saved += sum(found[chunk_id][1] for chunk_id in chunk_ids if chunk_id in found)
+        return found
+
+    def put_many(self, rows: Iterable[Tuple[str, List[str], float]], extractor_version: str):
+        """Stores (chunk_id, keywords, elapsed seconds) rows."""
+        if not self.enabled:
+            return
+        with self._lock:
+            conn = self._connect()
+            conn.executemany(
+                "INSERT OR REPLACE INTO ner_cache (chunk_id, extractor_version, keywords, elapsed) VALUES (?, ?, ?, ?)",
+                [(chunk_id, extractor_version, json.dumps(keywords), elapsed) for chunk_id, keywords, elapsed in rows],
+            )
+            conn.commit()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "seconds_saved": self.seconds_saved,
+            }
+
+
+ner_cache = NERCache()
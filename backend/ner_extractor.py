@@ -1,32 +1,181 @@
 # ner_extractor.py
 
+from __future__ import annotations
+
 import re
-from typing import List, Dict
+from typing import List, Dict, Iterable, TYPE_CHECKING
 import string
-from collections import defaultdict
+from collections import OrderedDict
+import hashlib
+import json
+import threading
 import time
 
-import spacy
-import yake
-from nltk.corpus import stopwords
-import nltk
-from spacy.tokens import Doc, Span
 # You may need to install this: pip install python-dateutil
 from dateutil.parser import parse
+from config import NER_BATCH_SIZE, NER_N_PROCESS, CANDIDATE_MEMO_SIZE, DATE_MEMO_SIZE, SPACY_PROFILE
+from keyword_postings import KeywordPostings, PostingsBuilder
+from ner_cache import ner_cache
+from nlp_resources import ensure_nltk_data
 
-nltk.download("stopwords", quiet=True)
-STOPWORDS = set(stopwords.words("english"))
-STOPWORDS.add('pg_no')
-STOPWORDS.add('cnk')
+if TYPE_CHECKING:
+    from spacy.language import Language
+    from spacy.tokens import Doc, Span
 
 YAKE_MAX_NGRAM_SIZE = 3
 YAKE_NUM_KEYWORDS = 40
 YAKE_DEDUP_THRESHOLD = 0.9
 
-# --- Use a faster spaCy model ---
-print("Loading spaCy model...")
-nlp = spacy.load("en_core_web_sm")
-print("Model loaded.")
+SPACY_MODEL = "en_core_web_sm"
+
+# Extraction profiles: which pipeline components to load. extract_spacy
+# needs entities, noun phrases, POS tags and lemmas.
+#   full - every default component; noun phrases come from the dependency
+#          parser's doc.noun_chunks
+#   fast - no parser; a rule-based sentencizer sets sentence boundaries and
+#          noun phrases are approximated by runs of ADJ/NOUN/PROPN tokens
+SPACY_PROFILES = {
+    "full": {"exclude": [], "sentencizer": False},
+    "fast": {"exclude": ["parser", "senter"], "sentencizer": True},
+}
+
+# The spaCy model and the stopword corpus are loaded on first use (or by
+# warm_up()), not at import, so importing this module stays cheap.
+_nlp_by_profile = {}
+_stopwords = None
+_load_lock = threading.Lock()
+
+
+def get_nlp(profile: str = None) -> Language:
+    """The shared spaCy pipeline for a profile (default SPACY_PROFILE), loaded once on first use."""
+    profile = profile or SPACY_PROFILE
+    nlp = _nlp_by_profile.get(profile)
+    if nlp is None:
+        if profile not in SPACY_PROFILES:
+            raise ValueError(f"Unknown SPACY_PROFILE '{profile}', expected one of {sorted(SPACY_PROFILES)}")
+        with _load_lock:
+            nlp = _nlp_by_profile.get(profile)
+            if nlp is None:
+                import spacy
+                settings = SPACY_PROFILES[profile]
+                print(f"Loading spaCy model ({profile} profile)...")
+                nlp = spacy.load(SPACY_MODEL, exclude=settings["exclude"])
+                if settings["sentencizer"]:
+                    nlp.add_pipe("sentencizer", first=True)
+                _nlp_by_profile[profile] = nlp
+                print(f"Model loaded: {', '.join(nlp.pipe_names)}")
+    return nlp
+
+
+def get_stopwords() -> set:
+    """NLTK English stopwords plus the chunk-prefix tokens, loaded once on first use."""
+    global _stopwords
+    if _stopwords is None:
+        with _load_lock:
+            if _stopwords is None:
+                ensure_nltk_data("corpora/stopwords", "stopwords")
+                from nltk.corpus import stopwords
+                words = set(stopwords.words("english"))
+                words.add('pg_no')
+                words.add('cnk')
+                _stopwords = words
+    return _stopwords
+
+
+def warm_up():
+    """Loads the spaCy model and stopwords now instead of on the first request."""
+    get_nlp()
+    get_stopwords()
+
+# Components normalize_span depends on (POS tags and lemmas)
+CANDIDATE_COMPONENTS = {"tok2vec", "tagger", "attribute_ruler", "lemmatizer"}
+
+
+class LRUMemo:
+    """
+    A thread-safe, size-bounded least-recently-used memo with hit/miss
+    counters. Entries may record the seconds it took to compute them;
+    every hit adds that to seconds_saved. Lookups a caller could rule out
+    without computing anything are counted with skip().
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.seconds_saved = 0.0
+        self.skips = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                value, cost = self._data[key]
+                self.seconds_saved += cost
+                return value
+            self.misses += 1
+            return None
+
+    def skip(self):
+        with self._lock:
+            self.skips += 1
+
+    def put(self, key, value, cost: float = 0.0):
+        with self._lock:
+            self._data[key] = (value, cost)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+
+# Normalized forms of regex/YAKE candidates; party names and section
+# titles repeat on every page, so this is shared across uploads
+CANDIDATE_MEMO = LRUMemo(CANDIDATE_MEMO_SIZE)
+
+# dateutil results per DATE entity text, including failures (""): policy
+# documents repeat the same few date phrases on every page
+DATE_MEMO = LRUMemo(DATE_MEMO_SIZE)
+
+# Bump whenever the extraction/normalization rules below change, so cached
+# per-chunk keywords (ner_cache) from older rules are no longer used
+EXTRACTOR_RULES_VERSION = "1"
+_extractor_version = None
+
+
+def extractor_version() -> str:
+    """
+    Hash of everything that determines a chunk's keywords: rules, spaCy and
+    model versions, pipeline and stopwords. The model's meta.json is read
+    from its package, so this never loads the spaCy pipeline.
+    """
+    global _extractor_version
+    if _extractor_version is None:
+        import spacy
+        from spacy.util import get_model_meta, get_package_path
+        if SPACY_PROFILE not in SPACY_PROFILES:
+            raise ValueError(f"Unknown SPACY_PROFILE '{SPACY_PROFILE}', expected one of {sorted(SPACY_PROFILES)}")
+        settings = SPACY_PROFILES[SPACY_PROFILE]
+        try:
+            meta = get_model_meta(get_package_path(SPACY_MODEL))
+        except (ImportError, OSError, ValueError):
+            # get_nlp() reports the missing model when extraction starts
+            meta = {}
+        # The pipe names get_nlp() ends up with for this profile
+        pipeline = [name for name in meta.get("pipeline", []) if name not in settings["exclude"]]
+        if settings["sentencizer"]:
+            pipeline.insert(0, "sentencizer")
+        fingerprint = json.dumps({
+            "rules": EXTRACTOR_RULES_VERSION,
+            "spacy": spacy.__version__,
+            "model": f"{meta.get('lang')}_{meta.get('name')}-{meta.get('version')}",
+            "pipeline": pipeline,
+            "stopwords": sorted(get_stopwords()),
+        })
+        _extractor_version = hashlib.sha256(fingerprint.encode()).hexdigest()[:16]
+    return _extractor_version
 
 
 # ----------------------------
@@ -44,30 +193,52 @@ def clean_text(text: str) -> str:
 # ----------------------------
 def normalize_span(span: Span) -> str:
     """Normalizes a spaCy span for general text keywords."""
+    stopwords = get_stopwords()
     noun_tokens = [
         token.lemma_.lower()
         for token in span
         if token.pos_ in {"NOUN", "PROPN"}
     ]
     if not noun_tokens: return ""
-    while noun_tokens and noun_tokens[0] in STOPWORDS: noun_tokens.pop(0)
-    while noun_tokens and noun_tokens[-1] in STOPWORDS: noun_tokens.pop()
+    while noun_tokens and noun_tokens[0] in stopwords: noun_tokens.pop(0)
+    while noun_tokens and noun_tokens[-1] in stopwords: noun_tokens.pop()
     if not noun_tokens: return ""
     normalized = " ".join(noun_tokens)
     normalized = normalized.translate(str.maketrans("", "", string.punctuation))
     normalized = re.sub(r"\s+", " ", normalized)
     return normalized.strip()
 
+# dateutil can only produce a date from text with a digit or a month/weekday name
+DATE_HINT_RE = re.compile(
+    r"\d|\b(?:jan(?:uary)?|feb(?:ruary)?|mar(?:ch)?|apr(?:il)?|may|june?|july?|aug(?:ust)?|"
+    r"sep(?:t(?:ember)?)?|oct(?:ober)?|nov(?:ember)?|dec(?:ember)?|mon(?:day)?|tue(?:s(?:day)?)?|"
+    r"wed(?:nesday)?|thu(?:r(?:s(?:day)?)?)?|fri(?:day)?|sat(?:urday)?|sun(?:day)?)\b",
+    re.IGNORECASE,
+)
+
+
 ### NEW FUNCTION ###
 def normalize_date(span: Span) -> str:
     """Normalizes a spaCy DATE entity to YYYY-MM-DD format."""
+    text = span.text
+    if not DATE_HINT_RE.search(text):
+        # e.g. "the effective date", "annually": parse would only raise
+        DATE_MEMO.skip()
+        return ""
+    cached = DATE_MEMO.get(text)
+    if cached is not None:
+        return cached
+
+    start = time.perf_counter()
     try:
         # dateutil.parser is very robust at parsing various date formats
-        dt = parse(span.text)
-        return dt.strftime("%Y-%m-%d")
+        dt = parse(text)
+        normalized = dt.strftime("%Y-%m-%d")
     except (ValueError, OverflowError):
         # Return empty if it's not a parsable date
-        return ""
+        normalized = ""
+    DATE_MEMO.put(text, normalized, time.perf_counter() - start)
+    return normalized
 
 ### NEW FUNCTION ###
 def normalize_number(span: Span) -> str:
@@ -84,7 +255,7 @@ def normalize_number(span: Span) -> str:
 def post_process_keyword(kw: str) -> str:
     """Cleans a normalized keyword by removing leading single-character stopwords."""
     tokens = kw.split()
-    if len(tokens) > 1 and len(tokens[0]) == 1 and tokens[0] in STOPWORDS:
+    if len(tokens) > 1 and len(tokens[0]) == 1 and tokens[0] in get_stopwords():
         return " ".join(tokens[1:])
     return kw
 
@@ -98,7 +269,8 @@ def is_valid_keyword(kw: str) -> bool:
     # We now rely on the more intelligent normalize_number function.
 
     tokens = kw.split()
-    if all(t in STOPWORDS or t in string.punctuation for t in tokens):
+    stopwords = get_stopwords()
+    if all(t in stopwords or t in string.punctuation for t in tokens):
         return False
     if len("".join(tokens)) <= 2:
         return False
@@ -108,6 +280,7 @@ def is_valid_keyword(kw: str) -> bool:
 # Extractor Functions
 # ----------------------------
 def extract_yake(text: str) -> List[str]:
+    import yake
     kw_extractor = yake.KeywordExtractor(
         lan="en", n=YAKE_MAX_NGRAM_SIZE, dedupLim=YAKE_DEDUP_THRESHOLD,
         top=YAKE_NUM_KEYWORDS, features=None
@@ -122,6 +295,34 @@ def extract_names_regex(text: str) -> List[str]:
     candidates.update([a.strip() for a in all_caps])
     return list(candidates)
 
+
+NOUN_PHRASE_POS = {"ADJ", "NOUN", "PROPN"}
+
+
+def noun_phrases(doc: Doc) -> Iterable[Span]:
+    """
+    doc.noun_chunks when the doc was dependency parsed; otherwise (fast
+    profile) maximal runs of ADJ/NOUN/PROPN tokens within a sentence that
+    contain at least one noun.
+    """
+    if doc.has_annotation("DEP"):
+        return doc.noun_chunks
+    spans = []
+    for sent in doc.sents:
+        start = None
+        for token in sent:
+            if token.pos_ in NOUN_PHRASE_POS:
+                if start is None:
+                    start = token.i
+                continue
+            if start is not None:
+                spans.append(doc[start:token.i])
+                start = None
+        if start is not None:
+            spans.append(doc[start:sent.end])
+    return [span for span in spans if any(t.pos_ in {"NOUN", "PROPN"} for t in span)]
+
+
 ### MODIFIED AND IMPROVED FUNCTION ###
 def extract_spacy(doc: Doc) -> List[str]:
     """
@@ -145,9 +346,10 @@ def extract_spacy(doc: Doc) -> List[str]:
             if normalized: results.add(normalized)
 
     # Process noun chunks for more general keywords
-    for chunk in doc.noun_chunks:
+    entity_texts = {e.text for e in doc.ents}
+    for chunk in noun_phrases(doc):
         # Avoid double-processing something that was already an entity
-        if chunk.text not in [e.text for e in doc.ents]:
+        if chunk.text not in entity_texts:
              normalized = normalize_span(chunk)
              if normalized: results.add(normalized)
              
@@ -157,12 +359,103 @@ def extract_spacy(doc: Doc) -> List[str]:
 # ----------------------------
 # Deduplication
 # ----------------------------
+class SubstringIndex:
+    """
+    Generalized suffix automaton over a growing set of strings.
+    `kw in index` is True iff kw is a substring of some added string; both
+    adding a string and querying are linear in the string's length.
+    """
+
+    __slots__ = ("next", "link", "length", "size")
+
+    def __init__(self):
+        self.next = [{}]
+        self.link = [-1]
+        self.length = [0]
+        self.size = 0
+
+    def add(self, text: str):
+        nxt, link, length = self.next, self.link, self.length
+        last = 0
+        for ch in text:
+            q = nxt[last].get(ch)
+            if q is not None:
+                # Prefix already known (shared with an earlier string)
+                if length[last] + 1 == length[q]:
+                    last = q
+                    continue
+                p = last
+                cur = None
+            else:
+                cur = len(nxt)
+                nxt.append({})
+                link.append(0)
+                length.append(length[last] + 1)
+                p = last
+                while p != -1 and ch not in nxt[p]:
+                    nxt[p][ch] = cur
+                    p = link[p]
+                if p == -1:
+                    last = cur
+                    continue
+                q = nxt[p][ch]
+                if length[p] + 1 == length[q]:
+                    link[cur] = q
+                    last = cur
+                    continue
+
+            # Split q: the clone takes the shorter strings of q's class
+            clone = len(nxt)
+            nxt.append(dict(nxt[q]))
+            link.append(link[q])
+            length.append(length[p] + 1)
+            while p != -1 and nxt[p].get(ch) == q:
+                nxt[p][ch] = clone
+                p = link[p]
+            link[q] = clone
+            if cur is None:
+                last = clone
+            else:
+                link[cur] = clone
+                last = cur
+        self.size += 1
+
+    def __contains__(self, text: str) -> bool:
+        if not self.size:
+            return False
+        nxt = self.next
+        state = 0
+        for ch in text:
+            state = nxt[state].get(ch)
+            if state is None:
+                return False
+        return True
+
+
+# Below this many keywords the plain scan is cheaper than building an automaton
+SUBSTRING_INDEX_MIN_KEYWORDS = 64
+
+
 def deduplicate_keywords(keywords: List[str]) -> List[str]:
+    """
+    Keeps the longest keywords and drops every keyword that is a substring
+    of one already kept (including repeats). Large lists are checked
+    against a suffix automaton of the kept keywords instead of scanning
+    each of them; both paths give identical results.
+    """
     keywords.sort(key=len, reverse=True)
     final_keywords = []
-    superstrings = set()
+    if len(keywords) < SUBSTRING_INDEX_MIN_KEYWORDS:
+        superstrings = set()
+        for kw in keywords:
+            if not any(kw in s for s in superstrings):
+                final_keywords.append(kw)
+                superstrings.add(kw)
+        return final_keywords
+
+    superstrings = SubstringIndex()
     for kw in keywords:
-        if not any(kw in s for s in superstrings):
+        if kw not in superstrings:
             final_keywords.append(kw)
             superstrings.add(kw)
     return final_keywords
@@ -173,49 +466,179 @@ def deduplicate_keywords(keywords: List[str]) -> List[str]:
 # ----------------------------
 def extract_keywords(text: str) -> List[str]:
     clean_doc_text = clean_text(text)
-    doc = nlp(clean_doc_text)
+    doc = get_nlp()(clean_doc_text)
+    return keywords_from_doc(doc, clean_doc_text)
 
-    # Step 1: Extract candidates. spaCy is now the primary, intelligent source.
+
+def extract_candidates(doc: Doc, clean_doc_text: str):
+    """Step 1: already normalized spaCy keywords plus raw candidates that still need normalizing."""
+    # spaCy is now the primary, intelligent source.
     spacy_keywords = extract_spacy(doc)
     yake_keywords = []#extract_yake(clean_doc_text)
     regex_names = extract_names_regex(clean_doc_text)
-    
+
     # Create a combined set of raw text from YAKE and Regex for normalization
     other_raw_keywords = set(yake_keywords + regex_names)
+    return spacy_keywords, other_raw_keywords
 
-    # Step 2: Normalize and post-process the other raw candidates
+
+def normalize_candidates(raw_keywords: Iterable[str], batch_size: int = NER_BATCH_SIZE) -> Dict[str, str]:
+    """
+    Step 2: normalizes and post-processes raw candidate keywords.
+
+    Candidates missing from the process-wide memo are parsed together with
+    nlp.pipe, running only the components normalize_span needs (POS tags
+    and lemmas); every other component of the loaded profile is disabled.
+    Returns raw keyword -> post-processed keyword ("" if the
+    candidate normalizes to nothing).
+    """
+    normalized = {}
+    misses = []
+    for raw_kw in set(raw_keywords):
+        cached = CANDIDATE_MEMO.get(raw_kw)
+        if cached is None:
+            misses.append(raw_kw)
+        else:
+            normalized[raw_kw] = cached
+
+    if misses:
+        nlp = get_nlp()
+        disable = [name for name in nlp.pipe_names if name not in CANDIDATE_COMPONENTS]
+        for raw_kw, kw_doc in zip(misses, nlp.pipe(misses, batch_size=batch_size, disable=disable)):
+            post_processed = post_process_keyword(normalize_span(kw_doc[:]))
+            CANDIDATE_MEMO.put(raw_kw, post_processed)
+            normalized[raw_kw] = post_processed
+    return normalized
+
+
+def finalize_keywords(spacy_keywords: List[str], raw_keywords: Iterable[str], normalized: Dict[str, str]) -> List[str]:
+    """Step 3: merges the normalized candidates, then validates and deduplicates them."""
     normalized_and_processed = set(spacy_keywords) # Start with the already-processed spaCy keywords
-    for raw_kw in other_raw_keywords:
-        kw_doc = nlp(raw_kw)
-        normalized = normalize_span(kw_doc[:])
-        post_processed = post_process_keyword(normalized)
-        if post_processed:
-            normalized_and_processed.add(post_processed)
-
-    # Step 3: Final validation and deduplication
+    for raw_kw in raw_keywords:
+        if normalized[raw_kw]:
+            normalized_and_processed.add(normalized[raw_kw])
+
     validated_keywords = [kw for kw in normalized_and_processed if is_valid_keyword(kw)]
-    final_keywords = deduplicate_keywords(validated_keywords)
-    
-    return final_keywords
+    return deduplicate_keywords(validated_keywords)
+
+
+def keywords_from_doc(doc: Doc, clean_doc_text: str) -> List[str]:
+    """Runs the candidate, normalization and dedup steps on an already parsed chunk."""
+    spacy_keywords, raw_keywords = extract_candidates(doc, clean_doc_text)
+    return finalize_keywords(spacy_keywords, raw_keywords, normalize_candidates(raw_keywords))
 
 
 # ----------------------------
 # Keyword to Chunk Mapping
 # ----------------------------
-def map_keywords_to_chunks(chunks: List[str]) -> Dict[str, List[str]]:
-    print(f"Processing {len(chunks)} chunks...")
-    keyword_map = defaultdict(set)
+def map_keywords_to_chunks(
+    chunks: Iterable[str],
+    batch_size: int = NER_BATCH_SIZE,
+    n_process: int = NER_N_PROCESS,
+) -> KeywordPostings:
+    """
+    Maps each keyword to the chunks it appears in, as compact posting lists
+    of chunk ids over a chunk table (see keyword_postings.KeywordPostings).
+    `chunks` may be a list or a lazy stream such as chunker2.ChunkStream;
+    it is consumed once and never materialized here.
+
+    Cleaned chunks are parsed with nlp.pipe in batches of `batch_size` on
+    `n_process` processes, and the raw candidates of each batch of chunks
+    are normalized together; the keywords per chunk are the same as
+    calling extract_keywords on each chunk.
+
+    Chunks whose keywords are already in the persistent NER cache (keyed
+    by chunk_id and extractor_version()) skip spaCy entirely.
+    """
+    return collect_keywords(chunks, PostingsBuilder(), batch_size, n_process).build()
+
+
+def collect_keywords(
+    chunks: Iterable[str],
+    postings: PostingsBuilder,
+    batch_size: int = NER_BATCH_SIZE,
+    n_process: int = NER_N_PROCESS,
+) -> PostingsBuilder:
+    """
+    The NER pass of map_keywords_to_chunks: records every chunk's keywords
+    in `postings` and returns it unbuilt, so a SpooledPostingsBuilder can be
+    filtered (keyword_filter.filter_keys_streaming) before it is built.
+    """
+    total = len(chunks) if hasattr(chunks, "__len__") else None
+    print(f"Processing {total if total is not None else 'streamed'} chunks "
+          f"(batch_size={batch_size}, n_process={n_process})...")
     start_time = time.time()
-    for i, chunk in enumerate(chunks):
-        if (i + 1) % 10 == 0:
-                print(f"  - Processing chunk {i+1}/{len(chunks)}")
-        keywords_in_chunk = extract_keywords(chunk)
-        for kw in keywords_in_chunk:
-            keyword_map[kw].add(chunk)
-    final_map = {kw: list(chunk_set) for kw, chunk_set in keyword_map.items()}
-    end_time = time.time()
-    print(f"\nNER complete in {end_time - start_time:.2f} seconds.")
-    return final_map
+    memo_hits, memo_misses = CANDIDATE_MEMO.hits, CANDIDATE_MEMO.misses
+    date_hits, date_misses = DATE_MEMO.hits, DATE_MEMO.misses
+    date_saved, date_skips = DATE_MEMO.seconds_saved, DATE_MEMO.skips
+    version = extractor_version()
+    cache_stats = {"hits": 0, "seconds_saved": 0.0}
+    last_flush = time.time()
+
+    def uncached(chunk_stream):
+        """Looks chunks up in the NER cache a batch at a time; yields only the misses for spaCy."""
+        group = []
+        for chunk in chunk_stream:
+            group.append(chunk)
+            if len(group) >= batch_size:
+                yield from lookup(group)
+                group = []
+        if group:
+            yield from lookup(group)
+
+    def lookup(group):
+        chunk_ids = [hashlib.md5(chunk.encode()).hexdigest() for chunk in group]
+        cached = ner_cache.get_many(chunk_ids, version)
+        for chunk, chunk_id in zip(group, chunk_ids):
+            if chunk_id in cached:
+                keywords, elapsed = cached[chunk_id]
+                postings.add_chunk(chunk, keywords)
+                cache_stats["hits"] += 1
+                cache_stats["seconds_saved"] += elapsed
+            else:
+                yield clean_text(chunk), (chunk, chunk_id)
+
+    def flush(pending):
+        nonlocal last_flush
+        normalized = normalize_candidates(
+            (raw_kw for _, _, raw_keywords in pending for raw_kw in raw_keywords), batch_size
+        )
+        rows = []
+        for (chunk, chunk_id), spacy_keywords, raw_keywords in pending:
+            keywords = finalize_keywords(spacy_keywords, raw_keywords, normalized)
+            postings.add_chunk(chunk, keywords)
+            rows.append([chunk_id, keywords])
+        now = time.time()
+        per_chunk = (now - last_flush) / len(pending)
+        last_flush = now
+        ner_cache.put_many(((chunk_id, keywords, per_chunk) for chunk_id, keywords in rows), version)
+
+    pending = []
+    processed = 0
+    for doc, context in get_nlp().pipe(uncached(chunks), as_tuples=True, batch_size=batch_size, n_process=n_process):
+        processed += 1
+        if processed % 10 == 0:
+                print(f"  - Processing chunk {processed}/{total if total is not None else '?'}")
+        spacy_keywords, raw_keywords = extract_candidates(doc, doc.text)
+        pending.append((context, spacy_keywords, raw_keywords))
+        if len(pending) >= batch_size:
+            flush(pending)
+            pending = []
+    if pending:
+        flush(pending)
+
+    elapsed = time.time() - start_time
+    date_hits, date_misses = DATE_MEMO.hits - date_hits, DATE_MEMO.misses - date_misses
+    date_lookups = date_hits + date_misses
+    print(f"\nNER complete in {elapsed:.2f} seconds "
+          f"({processed / elapsed if elapsed else 0.0:.1f} chunks/sec, "
+          f"candidate memo {CANDIDATE_MEMO.hits - memo_hits} hits / {CANDIDATE_MEMO.misses - memo_misses} misses, "
+          f"date memo {date_hits} hits / {date_misses} misses "
+          f"({date_hits / date_lookups if date_lookups else 0.0:.0%}, ~{DATE_MEMO.seconds_saved - date_saved:.3f}s saved, "
+          f"{DATE_MEMO.skips - date_skips} pre-check skips), "
+          f"NER cache {cache_stats['hits']} hits / {processed} misses, "
+          f"~{cache_stats['seconds_saved']:.2f}s of NER skipped).")
+    return postings
 
 
 # ----------------------------
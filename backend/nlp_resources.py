@@ -0,0 +1,31 @@
+# nlp_resources.py
+
+import threading
+from config import NLP_OFFLINE
+
+_ready = set()
+_lock = threading.Lock()
+
+
+def ensure_nltk_data(resource: str, package: str):
+    """
+    Makes sure an NLTK resource (e.g. "tokenizers/punkt") is installed,
+    downloading `package` on first use. With NLP_OFFLINE set nothing is
+    ever downloaded and a missing resource raises LookupError instead.
+    """
+    if resource in _ready:
+        return
+    with _lock:
+        if resource in _ready:
+            return
+        import nltk
+        try:
+            nltk.data.find(resource)
+        except LookupError:
+            if NLP_OFFLINE:
+                raise LookupError(
+                    f"NLTK resource '{resource}' is not installed and NLP_OFFLINE is set; "
+                    f"install it at build time with nltk.download('{package}')"
+                )
+            nltk.download(package, quiet=True)
+        _ready.add(resource)
@@ -0,0 +1,56 @@
+import hashlib
+import random
+
+from chunker2 import dedup_chunks
+
+
+def chunk(content):
+    return {"content": content, "chunk_id": hashlib.md5(content.encode()).hexdigest()}
+
+
+def naive_dedup(chunks):
+    """The original pairwise scan from chunk_pdf."""
+    deduped_chunks = []
+    for i, chunk_i in enumerate(chunks):
+        content_i = chunk_i["content"]
+        is_subset = False
+        for j, chunk_j in enumerate(chunks):
+            if i != j:
+                if content_i in chunk_j["content"]:
+                    is_subset = True
+                    break
+        if not is_subset:
+            deduped_chunks.append(chunk_i)
+    return deduped_chunks
+
+
+def test_dedup_matches_pairwise_scan():
+    chunks = [chunk(text) for text in [
+        "Pg_no 1: The policy covers flood damage.",
+        "Pg_no 1: The policy covers flood damage. Fire is excluded.",
+        "Pg_no 1: Fire is excluded.",
+        "Pg_no 2: Theft is covered at night.",
+        "Pg_no 2: Theft is covered at night.",
+        "Pg_no 2: Claims are paid in 30 days.",
+        "Pg_no 3: Claims are paid in 30 days.",
+        "Pg_no 3: Claims are paid in 30 days. Pg_no 4: Appeals go to the board.",
+        "Pg_no 4: Appeals go to the board.",
+        "No page prefix at all.",
+        "No page prefix at all, but longer.",
+    ]]
+
+    assert dedup_chunks(chunks) == naive_dedup(chunks)
+
+
+def test_dedup_matches_pairwise_scan_on_generated_chunks():
+    rng = random.Random(7)
+    words = ["policy", "claim", "flood", "fire", "member", "premium", "benefit", "deductible"]
+    chunks = []
+    for page in range(1, 30):
+        sentences = [" ".join(rng.choices(words, k=rng.randint(2, 5))) + "." for _ in range(6)]
+        for _ in range(rng.randint(2, 6)):
+            start = rng.randrange(len(sentences))
+            end = rng.randint(start + 1, len(sentences))
+            chunks.append(chunk(f"Pg_no {page}: " + " ".join(sentences[start:end])))
+
+    assert dedup_chunks(chunks) == naive_dedup(chunks)
@@ -0,0 +1,89 @@
+"""
+Integration tests against a live Neo4j server. Set NEO4J_TEST_URI (and
+NEO4J_TEST_USER, NEO4J_TEST_PASSWORD, NEO4J_TEST_DATABASE as needed) to run
+them; every test writes its own thread and deletes it afterwards.
+"""
+import os
+import random
+import uuid
+
+import pytest
+
+pytest.importorskip("neo4j")
+pytestmark = pytest.mark.skipif(not os.getenv("NEO4J_TEST_URI"), reason="NEO4J_TEST_URI is not set")
+
+from graph_builder2 import KnowledgeGraphBuilder  # noqa: E402
+from graph_retriever2 import GraphRetriever  # noqa: E402
+from keyword_postings import KeywordPostings  # noqa: E402
+from memory_graph import MemoryGraphBuilder, MemoryGraphCache, MemoryGraphRetriever  # noqa: E402
+
+UNCAPPED = {"per_keyword": 10_000, "max_chunks": 10_000}
+
+
+def connection():
+    return (
+        os.environ["NEO4J_TEST_URI"],
+        os.getenv("NEO4J_TEST_USER", "neo4j"),
+        os.getenv("NEO4J_TEST_PASSWORD", ""),
+        os.getenv("NEO4J_TEST_DATABASE", "neo4j"),
+    )
+
+
+def small_graph(seed):
+    rng = random.Random(seed)
+    chunks = [f"Pg_no {i // 4 + 1}: clause {i}" for i in range(40)]
+    keyword_map = {f"term {k}": rng.sample(chunks, rng.randint(1, 8)) for k in range(15)}
+    return KeywordPostings.from_map(keyword_map, total_chunks=len(chunks))
+
+
+@pytest.fixture
+def retrievers(tmp_path):
+    """(Neo4j retriever, memory retriever) over the same small graph."""
+    postings = small_graph(11)
+    thread_id = f"test-{uuid.uuid4().hex}"
+    builder = KnowledgeGraphBuilder(*connection(), similarity_edges=False)
+    graphs = MemoryGraphCache(graph_dir=str(tmp_path))
+    MemoryGraphBuilder(graph_dir=str(tmp_path), similarity_edges=False, graphs=graphs) \
+        .build_graph_from_map(postings, thread_id)
+    try:
+        builder.build_graph_from_map(postings, thread_id)
+        yield GraphRetriever(*connection(), thread_id), MemoryGraphRetriever(thread_id=thread_id, graphs=graphs)
+    finally:
+        builder.clear_graph(thread_id, drop_version=True)
+
+
+def ids(chunks):
+    return [c["id"] for c in chunks]
+
+
+def test_primary_chunks_match_memory_backend(retrievers):
+    neo4j_retriever, memory_retriever = retrievers
+    keywords = ["term 0", "term 3", "term 7"]
+
+    expected = memory_retriever.primary_chunks(keywords, top_k=10)
+    result = neo4j_retriever.primary_chunks(keywords, top_k=10)
+
+    assert ids(result) == ids(expected)
+    assert [c["score"] for c in result] == pytest.approx([c["score"] for c in expected])
+
+
+@pytest.mark.parametrize("depth", [1, 2, 3])
+def test_bounded_expansion_matches_iterative(retrievers, depth):
+    neo4j_retriever, _ = retrievers
+    seeds = neo4j_retriever.primary_chunks(["term 0"], top_k=2)
+
+    iterative = neo4j_retriever.expand_iterative(seeds, max_depth=depth)
+    bounded = neo4j_retriever.expand_bounded(seeds, max_depth=depth, **UNCAPPED)
+
+    assert sorted(ids(bounded)) == sorted(ids(iterative))
+    assert all(c["content"] for c in bounded)
+
+
+def test_capped_expansion_matches_memory_backend(retrievers):
+    neo4j_retriever, memory_retriever = retrievers
+    seeds = memory_retriever.primary_chunks(["term 1", "term 2"], top_k=3)
+
+    for per_keyword, max_chunks in [(1, 4), (2, 6), (3, 10)]:
+        expected = memory_retriever.expand_bounded(seeds, max_depth=2, per_keyword=per_keyword, max_chunks=max_chunks)
+        result = neo4j_retriever.expand_bounded(seeds, max_depth=2, per_keyword=per_keyword, max_chunks=max_chunks)
+        assert ids(result) == ids(expected)
@@ -0,0 +1,128 @@
+import math
+import random
+
+import pytest
+
+import keyword_filter
+from keyword_filter import StreamingDocumentFrequency, filter_keys, filter_keys_streaming
+from keyword_postings import KeywordPostings, PostingsBuilder, SpooledPostingsBuilder
+
+TOTAL_CHUNKS = 100
+
+
+@pytest.fixture
+def keyword_map():
+    """keyword -> chunk texts; document frequencies spread around FREQUENCY_THRESHOLD (3%)."""
+    rng = random.Random(3)
+    chunks = [f"Pg_no {i // 4 + 1}: chunk {i}" for i in range(TOTAL_CHUNKS)]
+    return {f"keyword {k}": rng.sample(chunks, rng.randint(1, 8)) for k in range(60)}
+
+
+def naive_prevalence(key_chunk_map, total_chunks, threshold, keep_list):
+    """The original loop: keep protected keywords and those in at most `threshold` of chunks."""
+    return [kw for kw, chunks in key_chunk_map.items()
+            if kw in keep_list or len(chunks) / total_chunks <= threshold]
+
+
+def naive_idf(key_chunk_map, total_chunks):
+    return {kw: math.log((1 + total_chunks) / (1 + len(chunks))) + 1.0 for kw, chunks in key_chunk_map.items()}
+
+
+def naive_top_n(key_chunk_map, candidates, idf, n):
+    """Keywords among the n highest-IDF candidates of some chunk (ties by keyword order)."""
+    order = {kw: k for k, kw in enumerate(key_chunk_map)}
+    per_chunk = {}
+    for kw in candidates:
+        for chunk in key_chunk_map[kw]:
+            per_chunk.setdefault(chunk, []).append(kw)
+    kept = set()
+    for keywords in per_chunk.values():
+        kept.update(sorted(keywords, key=lambda kw: (-idf[kw], order[kw]))[:n])
+    return [kw for kw in candidates if kw in kept]
+
+
+def filtered(keyword_map, mode, n=3):
+    return filter_keys(KeywordPostings.from_map(keyword_map, TOTAL_CHUNKS), TOTAL_CHUNKS, mode=mode,
+                       keywords_per_chunk=n)
+
+
+def test_prevalence_matches_original_filter(keyword_map):
+    result = filtered(keyword_map, "prevalence")
+    expected = naive_prevalence(keyword_map, TOTAL_CHUNKS, keyword_filter.FREQUENCY_THRESHOLD, set())
+
+    assert 0 < len(expected) < len(keyword_map)
+    assert result.keys() == expected
+    assert {kw: set(chunks) for kw, chunks in result.items()} == {kw: set(keyword_map[kw]) for kw in expected}
+
+
+def test_keep_list_is_protected(keyword_map, monkeypatch):
+    generic = max(keyword_map, key=lambda kw: len(keyword_map[kw]))
+    monkeypatch.setattr(keyword_filter, "KEEP_LIST", {generic})
+
+    for mode in ("prevalence", "top_n", "both"):
+        assert generic in filtered(keyword_map, mode, n=1).keys()
+
+
+def test_idf_weights(keyword_map):
+    result = filtered(keyword_map, "prevalence")
+    idf = naive_idf(keyword_map, TOTAL_CHUNKS)
+
+    assert list(result.idf) == pytest.approx([idf[kw] for kw in result.keys()])
+
+
+def test_top_n_and_both(keyword_map):
+    idf = naive_idf(keyword_map, TOTAL_CHUNKS)
+    survivors = naive_prevalence(keyword_map, TOTAL_CHUNKS, keyword_filter.FREQUENCY_THRESHOLD, set())
+
+    top_n = naive_top_n(keyword_map, list(keyword_map), idf, 2)
+    assert len(top_n) < len(keyword_map)
+    assert filtered(keyword_map, "top_n", n=2).keys() == top_n
+    assert filtered(keyword_map, "both", n=2).keys() == naive_top_n(keyword_map, survivors, idf, 2)
+
+
+def test_unknown_mode(keyword_map):
+    with pytest.raises(ValueError):
+        filtered(keyword_map, "bogus")
+
+
+def chunk_keywords(seed):
+    """(chunk text, keywords) as NER yields them: Zipf-like keywords, repeated texts, keyword-less chunks."""
+    rng = random.Random(seed)
+    vocabulary = [f"keyword {k}" for k in range(300)]
+    weights = [1 / (k + 1) for k in range(len(vocabulary))]
+    chunks = [(f"Pg_no {i // 5 + 1}: chunk {i}", rng.choices(vocabulary, weights, k=rng.randint(0, 12)))
+              for i in range(400)]
+    return chunks + rng.sample(chunks, 20)
+
+
+@pytest.mark.parametrize("mode", ["prevalence", "both", "top_n"])
+@pytest.mark.parametrize("width", [65536, 16])
+def test_streaming_filter_matches_exact_filter(mode, width):
+    exact = PostingsBuilder()
+    document_frequency = StreamingDocumentFrequency(width=width, depth=3)
+    spooled = SpooledPostingsBuilder(on_chunk=document_frequency.add_chunk)
+    for chunk, keywords in chunk_keywords(5):
+        exact.add_chunk(chunk, keywords)
+        spooled.add_chunk(chunk, keywords)
+    key_chunk_map = exact.build()
+
+    expected = filter_keys(key_chunk_map, key_chunk_map.total_chunks, mode=mode, keywords_per_chunk=2)
+    result = filter_keys_streaming(spooled, document_frequency, mode=mode, keywords_per_chunk=2)
+
+    assert 0 < len(expected) < len(key_chunk_map)
+    assert result.keys() == expected.keys()
+    assert list(result.items()) == list(expected.items())
+    assert list(result.idf) == pytest.approx(list(expected.idf))
+    assert result.total_chunks == expected.total_chunks
+
+
+def test_sketch_estimates_are_upper_bounds():
+    document_frequency = StreamingDocumentFrequency(width=32, depth=2)
+    builder = PostingsBuilder()
+    for chunk, keywords in chunk_keywords(6):
+        if builder.add_chunk(chunk, keywords):
+            document_frequency.add_chunk(keywords)
+    key_chunk_map = builder.build()
+
+    for k, keyword in enumerate(key_chunk_map.keys()):
+        assert document_frequency.estimate(keyword) >= key_chunk_map.document_frequency(k)
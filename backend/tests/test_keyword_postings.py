@@ -0,0 +1,55 @@
+import random
+from collections import defaultdict
+
+from keyword_postings import KeywordPostings, PostingsBuilder
+
+
+def generated_chunks(seed):
+    rng = random.Random(seed)
+    vocabulary = [f"keyword {i}" for i in range(40)]
+    chunks = [(f"Pg_no {i // 3 + 1}: chunk text {i}", rng.sample(vocabulary, rng.randint(0, 6))) for i in range(60)]
+    # Repeated texts (with the same keywords) and chunks without keywords, as NER produces them
+    return chunks + rng.sample(chunks, 10)
+
+
+def naive_map(chunk_keywords):
+    """The old map_keywords_to_chunks result: keyword -> set of chunk texts."""
+    keyword_map = defaultdict(set)
+    for chunk, keywords in chunk_keywords:
+        for kw in keywords:
+            keyword_map[kw].add(chunk)
+    return keyword_map
+
+
+def as_sets(postings):
+    return {keyword: set(chunks) for keyword, chunks in postings.items()}
+
+
+def test_builder_matches_keyword_map():
+    chunk_keywords = generated_chunks(1)
+    builder = PostingsBuilder()
+    for chunk, keywords in chunk_keywords:
+        builder.add_chunk(chunk, keywords)
+    postings = builder.build()
+
+    assert as_sets(postings) == naive_map(chunk_keywords)
+    assert postings.total_chunks == len(chunk_keywords)
+    for k, keyword in enumerate(postings.keys()):
+        ids = list(postings.chunk_ids(k))
+        assert ids == sorted(set(ids))
+        assert postings.document_frequency(k) == len(naive_map(chunk_keywords)[keyword])
+
+
+def test_from_map_select_and_round_trip():
+    keyword_map = {kw: sorted(chunks) for kw, chunks in naive_map(generated_chunks(2)).items()}
+    postings = KeywordPostings.from_map(keyword_map, total_chunks=70)
+
+    assert as_sets(postings) == {kw: set(chunks) for kw, chunks in keyword_map.items()}
+    selected = postings.select([3, 0, 5])
+    assert selected.keys() == [postings.keys()[k] for k in (3, 0, 5)]
+    assert as_sets(selected) == {kw: set(keyword_map[kw]) for kw in selected.keys()}
+
+    restored = KeywordPostings.from_dict(postings.to_dict())
+    assert restored.keys() == postings.keys()
+    assert as_sets(restored) == as_sets(postings)
+    assert restored.total_chunks == 70
@@ -0,0 +1,38 @@
+import os
+
+import lexical_index
+from lexical_index import LexicalIndex, LexicalIndexCache
+
+KEYWORDS = ["civil union partner", "des moines", "accidental death benefit", "premium"]
+
+
+def test_save_and_load(tmp_path):
+    LexicalIndex.build(KEYWORDS, "v1").save("thread-1", str(tmp_path))
+    index = LexicalIndex.load("thread-1", str(tmp_path))
+
+    assert index.version == "v1"
+    assert index.keywords == KEYWORDS
+    assert index.search("civil union partners")["candidates"][0] == "civil union partner"
+    # No temp files are left behind
+    assert os.listdir(tmp_path) == ["thread-1.npz"]
+
+
+def test_corrupt_file_loads_as_missing(tmp_path):
+    LexicalIndex.build(KEYWORDS, "v1").save("thread-1", str(tmp_path))
+    path = LexicalIndex.path("thread-1", str(tmp_path))
+    with open(path, "r+b") as f:
+        f.truncate(os.path.getsize(path) // 2)
+
+    assert LexicalIndex.load("thread-1", str(tmp_path)) is None
+
+
+def test_cache_survives_a_failed_save(monkeypatch):
+    def failing_save(self, thread_id, index_dir=None):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(lexical_index.LexicalIndex, "load", classmethod(lambda cls, thread_id: None))
+    monkeypatch.setattr(lexical_index.LexicalIndex, "save", failing_save)
+    index = LexicalIndexCache().get("thread-1", "v1", KEYWORDS)
+
+    assert index.version == "v1"
+    assert index.search("des moines")["candidates"][0] == "des moines"
@@ -0,0 +1,120 @@
+import hashlib
+import os
+import random
+import shutil
+
+import numpy as np
+import pytest
+
+from keyword_filter import idf_weights
+from keyword_postings import KeywordPostings
+from memory_graph import CURRENT, MemoryGraph, MemoryGraphBuilder, MemoryGraphCache, MemoryGraphRetriever
+
+THREAD = "thread-1"
+BASEMENT = "Flood damage to the basement is covered."
+KITCHEN = "Flood and fire damage in the kitchen."
+NIGHT = "Fire and theft at night are excluded."
+
+
+def chunk_id(text):
+    return hashlib.md5(text.encode()).hexdigest()
+
+
+@pytest.fixture
+def graphs(tmp_path):
+    return MemoryGraphCache(graph_dir=str(tmp_path))
+
+
+@pytest.fixture
+def builder(tmp_path, graphs):
+    builder = MemoryGraphBuilder(graph_dir=str(tmp_path), similarity_edges=False, graphs=graphs)
+    # One extra chunk produced no keywords
+    postings = KeywordPostings.from_map(
+        {"flood": [BASEMENT, KITCHEN], "fire": [KITCHEN, NIGHT], "theft": [NIGHT]}, total_chunks=4
+    )
+    builder.build_graph_from_map(postings, THREAD)
+    return builder
+
+
+def test_primary_chunks_rank_by_idf(builder, graphs):
+    retriever = MemoryGraphRetriever(thread_id=THREAD, graphs=graphs)
+    chunks = retriever.primary_chunks(["flood", "fire", "unknown"])
+
+    weight = idf_weights(np.array([2]), 4)[0]
+    assert [c["id"] for c in chunks] == [chunk_id(KITCHEN)] + sorted([chunk_id(BASEMENT), chunk_id(NIGHT)])
+    assert chunks[0]["content"] == KITCHEN
+    assert chunks[0]["matched"] == 2
+    assert chunks[0]["score"] == pytest.approx(2 * weight)
+    assert chunks[1]["score"] == pytest.approx(weight)
+
+
+def test_expansion(builder, graphs):
+    retriever = MemoryGraphRetriever(thread_id=THREAD, graphs=graphs)
+    seed = [{"id": chunk_id(BASEMENT)}]
+
+    assert [c["id"] for c in retriever.expand_iterative(seed, max_depth=1)] == [chunk_id(KITCHEN)]
+    assert [c["id"] for c in retriever.expand_iterative(seed, max_depth=2)] == [chunk_id(KITCHEN), chunk_id(NIGHT)]
+    assert [c["id"] for c in retriever.expand_bounded(seed, max_depth=2)] == [chunk_id(KITCHEN), chunk_id(NIGHT)]
+
+    # The per-keyword cap applies to chunks not yet visited, so the seed itself never uses it up
+    found = retriever.expand_bounded([{"id": chunk_id(KITCHEN)}], max_depth=1, per_keyword=1)
+    assert sorted(c["id"] for c in found) == sorted([chunk_id(BASEMENT), chunk_id(NIGHT)])
+
+
+def test_sync_replaces_version(builder, graphs, tmp_path):
+    old_version = MemoryGraph.read_version(THREAD, str(tmp_path))
+    postings = KeywordPostings.from_map(
+        {"flood": [BASEMENT, KITCHEN], "fire": [NIGHT], "smoke": [KITCHEN]}, total_chunks=4
+    )
+    summary = builder.sync_graph_from_map(postings, THREAD)
+
+    assert {k: v for k, v in summary.items() if k != "timings"} == {
+        "chunks_added": 0, "chunks_removed": 0, "chunks_unchanged": 3,
+        "keywords_added": 1, "keywords_removed": 1, "keywords_updated": 1,
+        "edges_added": 1, "edges_removed": 2, "similar_added": 0, "similar_removed": 0,
+    }
+    version = MemoryGraph.read_version(THREAD, str(tmp_path))
+    assert version != old_version
+    assert sorted(os.listdir(os.path.join(tmp_path, THREAD))) == sorted([CURRENT, version])
+
+    graph = MemoryGraph.load(THREAD, str(tmp_path))
+    assert graph.version == version
+    assert dict(zip(graph.keywords, graph.df.tolist())) == {"flood": 2, "fire": 1, "smoke": 1}
+    assert graphs.get(THREAD).version == version
+
+
+def test_load_rejects_files_of_another_version(builder, tmp_path):
+    path = os.path.join(tmp_path, THREAD)
+    shutil.copytree(os.path.join(path, MemoryGraph.read_version(THREAD, str(tmp_path))), os.path.join(path, "other"))
+    with open(os.path.join(path, CURRENT), "w") as f:
+        f.write("other")
+
+    assert MemoryGraph.load(THREAD, str(tmp_path)) is None
+
+
+def test_clear_graph(builder, graphs, tmp_path):
+    deleted = builder.clear_graph(THREAD)
+
+    assert deleted == {"APPEARS_IN": 5, "SIMILAR_TO": 0, "Chunk": 3, "Keyword": 3}
+    assert MemoryGraph.read_version(THREAD, str(tmp_path)) is None
+    assert MemoryGraph.load(THREAD, str(tmp_path)) is None
+    assert graphs.get(THREAD) is None
+    assert builder.clear_graph(THREAD) == {"APPEARS_IN": 0, "SIMILAR_TO": 0, "Chunk": 0, "Keyword": 0}
+
+
+def test_uncapped_bounded_expansion_matches_iterative(tmp_path):
+    rng = random.Random(11)
+    chunks = [f"Pg_no {i // 4 + 1}: clause {i}" for i in range(40)]
+    postings = KeywordPostings.from_map(
+        {f"term {k}": rng.sample(chunks, rng.randint(1, 8)) for k in range(15)}, total_chunks=len(chunks)
+    )
+    graphs = MemoryGraphCache(graph_dir=str(tmp_path))
+    MemoryGraphBuilder(graph_dir=str(tmp_path), similarity_edges=False, graphs=graphs) \
+        .build_graph_from_map(postings, THREAD)
+    retriever = MemoryGraphRetriever(thread_id=THREAD, graphs=graphs)
+    seeds = retriever.primary_chunks(["term 0"], top_k=2)
+
+    for depth in (1, 2, 3):
+        iterative = retriever.expand_iterative(seeds, max_depth=depth)
+        bounded = retriever.expand_bounded(seeds, max_depth=depth, per_keyword=10_000, max_chunks=10_000)
+        assert sorted(c["id"] for c in bounded) == sorted(c["id"] for c in iterative)
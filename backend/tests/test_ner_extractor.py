@@ -0,0 +1,50 @@
+import random
+
+from ner_extractor import SUBSTRING_INDEX_MIN_KEYWORDS, SubstringIndex, deduplicate_keywords
+
+
+def naive_deduplicate(keywords):
+    """The original scan against every kept keyword."""
+    keywords = sorted(keywords, key=len, reverse=True)
+    final_keywords = []
+    superstrings = set()
+    for kw in keywords:
+        if not any(kw in s for s in superstrings):
+            final_keywords.append(kw)
+            superstrings.add(kw)
+    return final_keywords
+
+
+def generated_keywords(n, seed):
+    rng = random.Random(seed)
+    words = ["civil", "union", "partner", "life", "insurance", "company", "des", "moines", "death", "benefit"]
+    phrases = [" ".join(rng.choices(words, k=rng.randint(1, 4))) for _ in range(n)]
+    # Plain substrings of phrases as well, not only whole words
+    phrases += [p[rng.randrange(len(p)):] for p in rng.sample(phrases, n // 4)]
+    return phrases
+
+
+def test_substring_index():
+    index = SubstringIndex()
+    index.add("civil union partner")
+    index.add("des moines")
+
+    assert "union part" in index
+    assert "moines" in index
+    assert "civil union partner" in index
+    assert "partnership" not in index
+    assert "union des" not in index
+
+
+def test_deduplicate_keywords_matches_scan_on_small_lists():
+    keywords = ["civil union", "civil union partner", "union", "des moines", "moines", "duty", "due", "du"]
+
+    assert deduplicate_keywords(list(keywords)) == naive_deduplicate(keywords)
+
+
+def test_deduplicate_keywords_matches_scan_through_the_automaton():
+    for seed in range(3):
+        keywords = generated_keywords(4 * SUBSTRING_INDEX_MIN_KEYWORDS, seed)
+        assert len(keywords) >= SUBSTRING_INDEX_MIN_KEYWORDS
+
+        assert deduplicate_keywords(list(keywords)) == naive_deduplicate(keywords)